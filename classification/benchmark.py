@@ -0,0 +1,115 @@
+"""
+Benchmarks the video scoring of detect_from_video.py and prints the
+throughput and the per-stage latencies (decode, detect, crop, preprocess,
+forward and, with --display, write). Videos are only scored by default.
+
+Usage:
+python benchmark.py
+    -i <path to sample video, a synthetic video is generated if not given>
+    -m <path to model file>
+    additional VideoDetector options, see -h
+
+Author: Andreas Rössler
+"""
+import time
+import argparse
+import tempfile
+from os.path import join
+import cv2
+import dlib
+import numpy as np
+
+from detect_from_video import VideoDetector
+from video.pipeline import StageTimer
+
+
+class SyntheticFaceDetector(VideoDetector):
+    """
+    Synthetic videos do not contain faces. The face detector still runs (so
+    its cost is measured) but a fixed centered box is returned as face.
+    """
+    def detect_face(self, image):
+        super(SyntheticFaceDetector, self).detect_face(image)
+        height, width = image.shape[:2]
+        size = min(height, width) // 3
+        x, y = (width - size) // 2, (height - size) // 2
+        return dlib.rectangle(x, y, x + size, y + size)
+
+
+def make_synthetic_video(path, num_frames=300, width=1280, height=720,
+                         fps=30):
+    """Writes a video with smooth random content that moves over time."""
+    rng = np.random.RandomState(0)
+    pattern = rng.randint(0, 256, (height // 16, width // 16 * 2, 3))
+    pattern = cv2.resize(pattern.astype(np.uint8), (2 * width, height),
+                         interpolation=cv2.INTER_CUBIC)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps,
+                             (width, height))
+    for i in range(num_frames):
+        offset = (4 * i) % width
+        writer.write(np.ascontiguousarray(pattern[:, offset:offset + width]))
+    writer.release()
+
+
+def benchmark(video_path=None, num_frames=300, runs=1, **detector_kwargs):
+    """
+    :param video_path: sample video, if None a synthetic video is used
+    :param num_frames: number of frames of the synthetic video
+    :param runs: number of times the video is scored, timings are merged
+    :param detector_kwargs: keyword arguments of VideoDetector
+    :return: video.pipeline.StageTimer with all measurements
+    """
+    tmp_dir = None
+    detector_class = VideoDetector
+    if video_path is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        video_path = join(tmp_dir.name, 'synthetic.avi')
+        make_synthetic_video(video_path, num_frames)
+        detector_class = SyntheticFaceDetector
+
+    start = time.perf_counter()
+    detector = detector_class(**detector_kwargs)
+    print('Startup: {:.2f}s'.format(time.perf_counter() - start))
+
+    output_path = tmp_dir.name if tmp_dir else tempfile.gettempdir()
+    timer = StageTimer()
+    num_evaluated = 0
+    start = time.perf_counter()
+    for _ in range(runs):
+        detector.score_video(video_path, output_path)
+        timer.merge(detector.timer)
+        num_evaluated += len(detector.timer.durations.get('decode', []))
+    elapsed = time.perf_counter() - start
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+
+    print(timer.report())
+    print('{} frames in {:.2f}s: {:.2f} frames/sec'.format(
+        num_evaluated, elapsed, num_evaluated / elapsed))
+    return timer
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument('--video_path', '-i', type=str, default=None)
+    p.add_argument('--model_path', '-mi', type=str, default=None)
+    p.add_argument('--num_frames', type=int, default=300,
+                   help='Number of frames of the synthetic video')
+    p.add_argument('--runs', type=int, default=1)
+    p.add_argument('--cuda', action='store_true')
+    p.add_argument('--batch_size', '-b', type=int, default=1)
+    p.add_argument('--display', action='store_true',
+                   help='Show and write the annotated video, displaying is '
+                        'not part of the measured stages but limits the '
+                        'throughput to about 30 frames/sec')
+    p.add_argument('--detect_every', type=int, default=1)
+    p.add_argument('--detection_size', type=int, default=None)
+    p.add_argument('--pipeline', action='store_true')
+    p.add_argument('--fast_preprocessing', action='store_true')
+    args = p.parse_args()
+    # Scores only by default
+    args.headless = not args.display
+    del args.display
+
+    benchmark(**vars(args))
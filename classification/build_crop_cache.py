@@ -0,0 +1,88 @@
+"""
+Builds face crop caches (see dataset/crop_cache.py) for the FaceForensics++
+splits, so that training and evaluation runs do not have to decode the
+videos and detect the faces again.
+
+Usage:
+python build_crop_cache.py
+    -i <FaceForensics++ root folder>
+    -o <output folder, will contain one cache per split>
+    --splits <paths to dataset/splits/*.json>
+
+Author: Andreas Rössler
+"""
+import os
+import argparse
+from os.path import join
+from tqdm import tqdm
+
+from detect_from_video import VideoDetector
+from dataset.crop_cache import CropCacheWriter
+from dataset.splits import split_videos, video_path, METHODS, COMPRESSION
+from network.models import MODEL_IMAGE_SIZES
+from video.sampling import FrameSampler, SAMPLING_POLICIES
+
+
+def build_crop_cache(detector, data_path, split_path, output_path,
+                     compression='c23', methods=METHODS, image_size=299,
+                     chunk_size=4096):
+    """
+    :param detector: VideoDetector, only its face detection and frame
+    sampling are used
+    :param data_path: FaceForensics++ root folder
+    :param split_path: json split file
+    :param output_path: cache folder
+    :param compression: video compression, one of COMPRESSION
+    :param methods: manipulation methods
+    :param image_size: crop size
+    :param chunk_size: number of crops per chunk file
+    """
+    writer = CropCacheWriter(output_path, image_size, chunk_size)
+    for dataset, name, label in tqdm(split_videos(split_path, methods)):
+        path = video_path(data_path, dataset, compression, name)
+        if not os.path.exists(path):
+            tqdm.write('Missing video {}'.format(path))
+            continue
+        for record, crop in detector.face_crops(path):
+            # Manipulated videos of different methods share their names
+            video = name if dataset == 'original' else dataset + '/' + name
+            writer.add(video, record['frame'], label, crop,
+                       (record['x'], record['y'], record['size']))
+    writer.close()
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument('--data_path', '-i', type=str, required=True)
+    p.add_argument('--output_path', '-o', type=str, required=True)
+    p.add_argument('--splits', type=str, nargs='+',
+                   default=['../dataset/splits/train.json',
+                            '../dataset/splits/val.json',
+                            '../dataset/splits/test.json'])
+    p.add_argument('--compression', '-c', type=str, default='c23',
+                   choices=COMPRESSION)
+    p.add_argument('--methods', type=str, nargs='+', default=METHODS)
+    p.add_argument('--modelname', type=str, default='xception',
+                   choices=list(MODEL_IMAGE_SIZES.keys()))
+    p.add_argument('--chunk_size', type=int, default=4096)
+    p.add_argument('--sampling', type=str, choices=SAMPLING_POLICIES,
+                   default='all')
+    p.add_argument('--stride', type=int, default=1)
+    p.add_argument('--num_samples', type=int, default=32)
+    p.add_argument('--detect_every', type=int, default=1)
+    p.add_argument('--detection_size', type=int, default=None)
+    args = p.parse_args()
+
+    detector = VideoDetector(
+        modelname=None, cuda=False, headless=True,
+        sampler=FrameSampler(args.sampling, stride=args.stride,
+                             num_samples=args.num_samples),
+        detect_every=args.detect_every, detection_size=args.detection_size)
+    for split_path in args.splits:
+        split = os.path.basename(split_path).split('.')[0]
+        print('Building {} crop cache'.format(split))
+        build_crop_cache(detector, args.data_path, split_path,
+                         join(args.output_path, split), args.compression,
+                         args.methods, MODEL_IMAGE_SIZES[args.modelname],
+                         args.chunk_size)
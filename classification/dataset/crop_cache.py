@@ -0,0 +1,140 @@
+"""
+Cache of pre-extracted face crops for training and evaluation. The crops
+(resized to the model input size, RGB, uint8) are stored in chunk files of
+fixed size that are memory mapped when read. An index maps every
+(video, frame) to its chunk and offset.
+
+Cache layout:
+    index.npy           structured array: video, frame, label, chunk, offset,
+                        x, y, size (bounding box in the original frame)
+    chunk_00000.npy     uint8 array [chunk_size, image_size, image_size, 3]
+    ...
+
+Author: Andreas Rössler
+"""
+import os
+from os.path import join
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+
+INDEX_DTYPE = [('video', 'U64'), ('frame', np.int32), ('label', np.int8),
+               ('chunk', np.int32), ('offset', np.int32), ('x', np.int32),
+               ('y', np.int32), ('size', np.int32)]
+
+
+def _chunk_path(cache_dir, chunk):
+    return join(cache_dir, 'chunk_{:05d}.npy'.format(chunk))
+
+
+class CropCacheWriter(object):
+    """
+    Appends face crops to a crop cache. The index is written on close, a
+    cache without index is incomplete.
+    """
+    def __init__(self, cache_dir, image_size=299, chunk_size=4096):
+        """
+        :param cache_dir: output folder
+        :param image_size: crops are resized to image_size x image_size
+        :param chunk_size: number of crops per chunk file
+        """
+        self.cache_dir = cache_dir
+        self.image_size = image_size
+        self.chunk_size = chunk_size
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = []
+        self.num_chunks = 0
+        self.chunk = None
+        self.offset = chunk_size
+
+    def add(self, video, frame, label, crop, bbox=(0, 0, 0)):
+        """
+        :param video: video name
+        :param frame: frame number
+        :param label: 1 = fake, 0 = real
+        :param crop: numpy image in opencv form (BGR)
+        :param bbox: (x, y, size) of the crop in the original frame
+        """
+        if self.offset == self.chunk_size:
+            self._next_chunk()
+        interpolation = cv2.INTER_AREA if min(crop.shape[:2]) > \
+            self.image_size else cv2.INTER_LINEAR
+        crop = cv2.resize(crop, (self.image_size, self.image_size),
+                          interpolation=interpolation)
+        # BGR -> RGB
+        self.chunk[self.offset] = crop[:, :, ::-1]
+        self.index.append((video, frame, label, self.num_chunks - 1,
+                           self.offset) + tuple(bbox))
+        self.offset += 1
+
+    def _next_chunk(self):
+        if self.chunk is not None:
+            self.chunk.flush()
+        self.chunk = np.lib.format.open_memmap(
+            _chunk_path(self.cache_dir, self.num_chunks), mode='w+',
+            dtype=np.uint8,
+            shape=(self.chunk_size, self.image_size, self.image_size, 3))
+        self.num_chunks += 1
+        self.offset = 0
+
+    def close(self):
+        if self.chunk is not None:
+            self.chunk.flush()
+            self.chunk = None
+        index_path = join(self.cache_dir, 'index.npy')
+        with open(index_path + '.tmp', 'wb') as f:
+            np.save(f, np.array(self.index, dtype=INDEX_DTYPE))
+        os.replace(index_path + '.tmp', index_path)
+
+
+class CropCacheDataset(Dataset):
+    """
+    Torch dataset over a crop cache. Chunks are memory mapped (copy on write)
+    in every worker process, samples are returned without copying as uint8
+    tensors of shape [3, image_size, image_size] (RGB).
+    """
+    def __init__(self, cache_dir, transform=None, videos=None):
+        """
+        :param cache_dir: folder written by CropCacheWriter
+        :param transform: optional function applied to the uint8 tensor
+        :param videos: optional subset of video names
+        """
+        self.cache_dir = cache_dir
+        self.transform = transform
+        self.index = np.load(join(cache_dir, 'index.npy'))
+        if videos is not None:
+            self.index = self.index[np.isin(self.index['video'],
+                                            list(videos))]
+        self.chunks = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def _chunk(self, chunk):
+        if chunk not in self.chunks:
+            self.chunks[chunk] = np.load(_chunk_path(self.cache_dir, chunk),
+                                         mmap_mode='c')
+        return self.chunks[chunk]
+
+    def __getitem__(self, i):
+        entry = self.index[i]
+        crop = self._chunk(int(entry['chunk']))[int(entry['offset'])]
+        image = torch.from_numpy(crop).permute(2, 0, 1)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, int(entry['label'])
+
+    def lookup(self, video, frame):
+        """:return: dataset position of (video, frame) or None"""
+        if not hasattr(self, '_positions'):
+            self._positions = {(str(e['video']), int(e['frame'])): i
+                               for i, e in enumerate(self.index)}
+        return self._positions.get((video, frame))
+
+
+def normalize(image, mean=0.5, std=0.5):
+    """Converts a uint8 crop tensor to the normalized float network input,
+    same as the xception test transform."""
+    return (image.float() / 255. - mean) / std
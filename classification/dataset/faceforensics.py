@@ -0,0 +1,180 @@
+"""
+Torch dataset over the extracted images of the FaceForensics++ folder
+structure (see dataset/extract_compressed_videos.py), i.e.,
+<data_path>/<DATASET_PATHS[dataset]>/<compression>/images/<video>/%04d.png
+or the frame stores <compression>/frames/<video>.npy (one memory mapped
+array per video, see dataset/frame_store.py).
+
+The image folders are only listed once to build a compact index with the
+number of frames of every video, every epoch samples frames per video from
+this index.
+
+Author: Andreas Rössler
+"""
+import os
+import inspect
+from os.path import join
+import cv2
+import numpy as np
+import torch
+from PIL import Image as pil_image
+from torch.utils.data import Dataset, DataLoader
+
+from dataset.splits import DATASET_PATHS, METHODS, split_videos, \
+    images_path, frames_path
+from dataset.frame_store import FrameStoreReader, num_stored_frames
+from dataset.transform import xception_default_data_transforms
+
+
+def build_index(data_path, compression='c23', datasets=None,
+                index_path=None, frame_store=False):
+    """
+    Counts the frames of all videos and saves them in an index file. An
+    existing index is loaded instead, unless videos have been added to or
+    removed from the indexed folders since it was built.
+    :param data_path: FaceForensics++ root folder
+    :param compression: one of dataset.splits.COMPRESSION
+    :param datasets: keys of DATASET_PATHS, defaults to all
+    :param index_path: index file, defaults to
+    <data_path>/index_<compression>.npz
+    (index_<compression>_frames.npz for frame stores, the datasets are
+    appended if not all datasets are indexed)
+    :param frame_store: index the frame stores instead of the image folders
+    Frames are expected to be named %04d.png starting from 0, as written by
+    extract_compressed_videos.py
+    :return: dict {(dataset, video): number of frames}
+    """
+    datasets = sorted(datasets or DATASET_PATHS.keys())
+    if index_path is None:
+        key = compression + ('_frames' if frame_store else '')
+        if datasets != sorted(DATASET_PATHS.keys()):
+            key += '_' + '_'.join(datasets)
+        index_path = join(data_path, 'index_{}.npz'.format(key))
+    folders = {dataset: join(data_path, DATASET_PATHS[dataset], compression,
+                             'frames' if frame_store else 'images')
+               for dataset in datasets}
+    # Completed videos are renamed into the folders by the extraction, which
+    # updates the modification time of the folder
+    if os.path.exists(index_path) and any(
+            os.path.exists(folder) and
+            os.path.getmtime(folder) > os.path.getmtime(index_path)
+            for folder in folders.values()):
+        print('Videos were added or removed since {} was built, '
+              'rebuilding'.format(index_path))
+        os.remove(index_path)
+    if not os.path.exists(index_path):
+        entries = []
+        for dataset, folder in folders.items():
+            if not os.path.exists(folder):
+                continue
+            for video in sorted(os.listdir(folder)):
+                # Skip temporary outputs of running or interrupted extractions
+                if frame_store:
+                    if not video.endswith('.npy') or \
+                            video.endswith('.tmp.npy'):
+                        continue
+                    entries.append((dataset, video[:-len('.npy')],
+                                    num_stored_frames(join(folder, video))))
+                elif not video.endswith('.tmp'):
+                    entries.append((dataset, video,
+                                    len(os.listdir(join(folder, video)))))
+        index = np.array(entries, dtype=[('dataset', 'U32'),
+                                         ('video', 'U64'),
+                                         ('num_frames', np.int32)])
+        with open(index_path + '.tmp', 'wb') as f:
+            np.savez(f, index=index)
+        os.replace(index_path + '.tmp', index_path)
+    index = np.load(index_path)['index']
+    return {(str(e['dataset']), str(e['video'])): int(e['num_frames'])
+            for e in index}
+
+
+class FaceForensicsDataset(Dataset):
+    """
+    Samples frames_per_video frames of every video of a split per epoch.
+    """
+    def __init__(self, data_path, split_path, compression='c23',
+                 methods=METHODS, frames_per_video=1, random_frames=True,
+                 transform=xception_default_data_transforms['train'],
+                 index_path=None, frame_store=False):
+        """
+        :param data_path: FaceForensics++ root folder
+        :param split_path: json split file, see dataset/splits
+        :param compression: one of dataset.splits.COMPRESSION
+        :param methods: manipulation methods
+        :param frames_per_video: number of samples per video and epoch
+        :param random_frames: sample random frames every epoch, otherwise
+        uniformly spaced frames are used (e.g., for evaluation)
+        :param transform: transform applied to the PIL image
+        :param index_path: see build_index
+        :param frame_store: read frames from the memory mapped frame stores
+        instead of the png images
+        """
+        self.data_path = data_path
+        self.compression = compression
+        self.frames_per_video = frames_per_video
+        self.random_frames = random_frames
+        self.transform = transform
+        self.frame_store = frame_store
+        # Opened lazily in every worker
+        self.frame_reader = None
+        num_frames = build_index(data_path, compression,
+                                 ['original'] + list(methods),
+                                 index_path=index_path,
+                                 frame_store=frame_store)
+        self.videos = []
+        missing = []
+        for dataset, video, label in split_videos(split_path, methods):
+            if num_frames.get((dataset, video), 0) > 0:
+                self.videos.append((dataset, video, label,
+                                    num_frames[(dataset, video)]))
+            else:
+                missing.append('{}/{}'.format(dataset, video))
+        if missing:
+            print('{} of {} videos of {} are not extracted and skipped: '
+                  '{}'.format(len(missing), len(missing) + len(self.videos),
+                              split_path, ', '.join(missing[:10]) +
+                              (', ...' if len(missing) > 10 else '')))
+
+    def __len__(self):
+        return len(self.videos) * self.frames_per_video
+
+    def __getitem__(self, i):
+        dataset, video, label, num_frames = \
+            self.videos[i // self.frames_per_video]
+        if self.random_frames:
+            # torch random numbers are seeded differently in every worker
+            frame = int(torch.randint(num_frames, (1,)))
+        else:
+            frame = int((i % self.frames_per_video + 0.5) * num_frames /
+                        self.frames_per_video)
+        if self.frame_store:
+            if self.frame_reader is None:
+                self.frame_reader = FrameStoreReader()
+            image = self.frame_reader(frames_path(
+                self.data_path, dataset, self.compression, video), frame)
+        else:
+            image = cv2.imread(join(images_path(self.data_path, dataset,
+                                                self.compression, video),
+                                    '{:04d}.png'.format(frame)))
+        image = pil_image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, label
+
+
+def make_dataloader(dataset, batch_size=32, shuffle=True, num_workers=4,
+                    prefetch_factor=2):
+    """
+    DataLoader with pinned memory and prefetching worker processes that are
+    kept alive between epochs (if supported by the torch version).
+    """
+    kwargs = {}
+    parameters = inspect.signature(DataLoader.__init__).parameters
+    if num_workers > 0 and 'prefetch_factor' in parameters:
+        kwargs['prefetch_factor'] = prefetch_factor
+    if num_workers > 0 and 'persistent_workers' in parameters:
+        kwargs['persistent_workers'] = True
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle,
+                      num_workers=num_workers,
+                      pin_memory=torch.cuda.is_available(), **kwargs)
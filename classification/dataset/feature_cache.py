@@ -0,0 +1,73 @@
+"""
+Disk cache for the features of forward_features of a TransferModel, keyed by
+video and frame number. Every video is stored as two numpy files, the frame
+numbers and a [num_frames, feature_dim] float32 array which is memory mapped
+when read, so that a new final layer can be evaluated without running the
+base model again.
+
+Author: Andreas Rössler
+"""
+import os
+from os.path import join
+import numpy as np
+import torch
+import torch.nn as nn
+
+
+class FeatureCache(object):
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, video):
+        return (join(self.cache_dir, video + '_frames.npy'),
+                join(self.cache_dir, video + '_features.npy'))
+
+    def write(self, video, frame_numbers, features):
+        """
+        :param video: video name
+        :param frame_numbers: list of frame numbers
+        :param features: array or tensor of shape [len(frame_numbers), dim]
+        """
+        if isinstance(features, torch.Tensor):
+            features = features.detach().cpu().numpy()
+        features = np.asarray(features, dtype=np.float32)
+        frames_path, features_path = self._paths(video)
+        # Frame numbers are renamed last, they mark a complete entry
+        for path, array in [(features_path, features),
+                            (frames_path, np.asarray(frame_numbers,
+                                                     dtype=np.int64))]:
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, array)
+            os.replace(path + '.tmp', path)
+
+    def __contains__(self, video):
+        return os.path.exists(self._paths(video)[0])
+
+    def videos(self):
+        return sorted(fn[:-len('_frames.npy')]
+                      for fn in os.listdir(self.cache_dir)
+                      if fn.endswith('_frames.npy'))
+
+    def read(self, video):
+        """
+        :param video: video name
+        :return: frame numbers, memory mapped features
+        """
+        frames_path, features_path = self._paths(video)
+        return np.load(frames_path), np.load(features_path, mmap_mode='r')
+
+    def predict(self, video, head, post_function=nn.Softmax(dim=1)):
+        """
+        Evaluates a final layer on the cached features of a video.
+        :param video: video name
+        :param head: module that maps features to class scores, e.g.,
+        TransferModel.classify_features
+        :param post_function: e.g., softmax
+        :return: frame numbers, output of shape [num_frames, num_classes]
+        """
+        frame_numbers, features = self.read(video)
+        with torch.no_grad():
+            output = post_function(head(torch.from_numpy(
+                np.ascontiguousarray(features))))
+        return frame_numbers, output
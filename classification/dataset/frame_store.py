@@ -0,0 +1,59 @@
+"""
+Reader of the frame stores written by dataset/extract_compressed_videos.py
+(--output_format npy), i.e., one uint8 .npy array
+[num_frames, height, width, 3] (BGR) per video in
+<data_path>/<DATASET_PATHS[dataset]>/<compression>/frames/<video>.npy
+
+Stores are memory mapped, reading a frame only touches its own pages.
+
+Author: Andreas Rössler
+"""
+import os
+import numpy as np
+
+
+def open_frame_store(path):
+    """Memory maps a frame store, nothing is read until frames are
+    accessed."""
+    return np.load(path, mmap_mode='r')
+
+
+def num_stored_frames(path):
+    """Number of frames of a frame store, only the header is read."""
+    with open(path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, _ = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, _ = np.lib.format.read_array_header_2_0(f)
+    return shape[0]
+
+
+class FrameStoreReader(object):
+    """
+    Keeps the most recently used frame stores memory mapped, e.g., for data
+    loader workers that sample frames of the same videos repeatedly.
+    """
+    def __init__(self, max_open=64):
+        """
+        :param max_open: maximum number of simultaneously mapped stores
+        """
+        self.max_open = max_open
+        self.stores = {}
+
+    def __call__(self, path, frame):
+        """
+        :param path: frame store
+        :param frame: frame number
+        :return: numpy image in opencv form (BGR)
+        """
+        store = self.stores.pop(path, None)
+        if store is None:
+            if not os.path.exists(path):
+                raise Exception('Wrong frame store path: {}'.format(path))
+            store = open_frame_store(path)
+            if len(self.stores) >= self.max_open:
+                # dicts keep insertion order, drop the least recently used
+                del self.stores[next(iter(self.stores))]
+        self.stores[path] = store
+        return np.array(store[frame])
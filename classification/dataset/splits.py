@@ -0,0 +1,55 @@
+"""
+FaceForensics++ folder structure and the train/val/test splits of
+dataset/splits/*.json.
+
+Author: Andreas Rössler
+"""
+import json
+from os.path import join
+
+
+# Same layout as dataset/extract_compressed_videos.py
+DATASET_PATHS = {
+    'original': 'original_sequences',
+    'Deepfakes': 'manipulated_sequences/Deepfakes',
+    'Face2Face': 'manipulated_sequences/Face2Face',
+    'FaceSwap': 'manipulated_sequences/FaceSwap'
+}
+COMPRESSION = ['c0', 'c23', 'c40']
+METHODS = ['Deepfakes', 'Face2Face', 'FaceSwap']
+
+
+def split_videos(split_path, methods=METHODS):
+    """
+    Lists all videos of a split. Every split entry is a [target, source] pair
+    of original sequences whose manipulated videos are named target_source
+    and source_target.
+    :param split_path: json file with a list of [target, source] pairs
+    :param methods: manipulation methods, keys of DATASET_PATHS
+    :return: list of (dataset, video name, label), label 1 = fake
+    """
+    with open(split_path, 'r') as f:
+        pairs = json.load(f)
+    videos = []
+    for pair in pairs:
+        videos += [('original', name, 0) for name in pair]
+        for method in methods:
+            videos += [(method, '_'.join(pair), 1),
+                       (method, '_'.join(pair[::-1]), 1)]
+    return videos
+
+
+def video_path(data_path, dataset, compression, name):
+    return join(data_path, DATASET_PATHS[dataset], compression, 'videos',
+                name + '.mp4')
+
+
+def images_path(data_path, dataset, compression, name):
+    return join(data_path, DATASET_PATHS[dataset], compression, 'images',
+                name)
+
+
+def frames_path(data_path, dataset, compression, name):
+    """Frame store of a video, see dataset/frame_store.py"""
+    return join(data_path, DATASET_PATHS[dataset], compression, 'frames',
+                name + '.npy')
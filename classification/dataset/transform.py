@@ -2,6 +2,9 @@
 
 Author: Andreas Rössler
 """
+import cv2
+import numpy as np
+import torch
 from torchvision import transforms
 
 xception_default_data_transforms = {
@@ -21,3 +24,55 @@ xception_default_data_transforms = {
         transforms.Normalize([0.5] * 3, [0.5] * 3)
     ]),
 }
+
+
+class BatchPreprocessor(object):
+    """
+    Numpy/OpenCV implementation of the xception test transform for batches of
+    opencv (BGR) face crops. Crops are resized with cv2.resize and written
+    into a preallocated float32 buffer that is normalized in place, which
+    avoids the PIL round trip and the intermediate copies of the torchvision
+    transform. The result matches xception_default_data_transforms['test']
+    up to interpolation differences.
+    """
+    def __init__(self, image_size=299, mean=(0.5, 0.5, 0.5),
+                 std=(0.5, 0.5, 0.5), batch_size=1):
+        """
+        :param image_size: output image size
+        :param mean: per channel (RGB) mean of the normalization
+        :param std: per channel (RGB) standard deviation of the normalization
+        :param batch_size: initial buffer size, grows if necessary
+        """
+        self.image_size = image_size
+        # x -> (x / 255 - mean) / std = x * scale - offset
+        std = np.asarray(std, dtype=np.float32).reshape(1, 3, 1, 1)
+        mean = np.asarray(mean, dtype=np.float32).reshape(1, 3, 1, 1)
+        self.scale = 1. / (255. * std)
+        self.offset = mean / std
+        self.buffer = np.empty((batch_size, 3, image_size, image_size),
+                               dtype=np.float32)
+
+    def __call__(self, images):
+        """
+        :param images: list of numpy images in opencv form (BGR, uint8)
+        :return: float tensor of shape [len(images), 3, image_size,
+        image_size], shares its memory with the buffer of the preprocessor
+        """
+        if len(images) > self.buffer.shape[0]:
+            self.buffer = np.empty((len(images),) + self.buffer.shape[1:],
+                                   dtype=np.float32)
+        batch = self.buffer[:len(images)]
+        size = self.image_size
+        for i, image in enumerate(images):
+            # Area interpolation is closer to PIL's antialiased bilinear
+            # filter when downscaling
+            interpolation = cv2.INTER_AREA if min(image.shape[:2]) > size \
+                else cv2.INTER_LINEAR
+            image = cv2.resize(image, (size, size),
+                               interpolation=interpolation)
+            # BGR -> RGB and HWC -> CHW, cast to float32 while copying
+            batch[i] = image[:, :, ::-1].transpose(2, 0, 1)
+        batch *= self.scale
+        batch -= self.offset
+        return torch.from_numpy(batch)
+
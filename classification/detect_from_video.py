@@ -11,7 +11,10 @@ python detect_from_video.py
 Author: Andreas Rössler
 """
 import os
+import json
+import contextlib
 import argparse
+import multiprocessing
 from os.path import join
 import cv2
 import dlib
@@ -20,8 +23,18 @@ import torch.nn as nn
 from PIL import Image as pil_image
 from tqdm import tqdm
 
-from network.models import model_selection
-from dataset.transform import xception_default_data_transforms
+from network.export import inference_mode
+from network.checkpoint import load_model
+from network.inference_profile import InferenceProfile
+from dataset.feature_cache import FeatureCache
+from dataset.transform import xception_default_data_transforms, \
+    BatchPreprocessor
+from video.records import open_record_writer, RECORD_FORMATS
+from video.sampling import FrameSampler, SAMPLING_POLICIES
+from video.tracking import FaceTracker
+from video.pipeline import StageTimer, BackgroundIterator
+from video.aggregate import aggregate_scores, AGGREGATION_METHODS, \
+    SequentialTest
 
 
 def get_boundingbox(face, width, height, scale=1.3, minsize=None):
@@ -102,119 +115,538 @@ def predict_with_model(image, model, post_function=nn.Softmax(dim=1),
     return int(prediction), output
 
 
+def predict_batch_with_model(images, model, post_function=nn.Softmax(dim=1),
+                             cuda=True, preprocessor=None, timer=None,
+                             profile=None, return_features=False):
+    """
+    Predicts the labels of a list of input images with a single forward pass.
+    Every image is preprocessed as in predict_with_model and the results are
+    stacked into one batch.
+
+    :param images: list of numpy images
+    :param model: torch model with linear layer at the end
+    :param post_function: e.g., softmax
+    :param cuda: enables cuda, must be the same parameter as the model
+    :param preprocessor: optional dataset.transform.BatchPreprocessor that
+    replaces the PIL based preprocessing
+    :param timer: optional video.pipeline.StageTimer that measures the
+    preprocess and forward stages
+    :param profile: optional network.inference_profile.InferenceProfile that
+    has been applied to the model
+    :param return_features: additionally return the features of
+    TransferModel.forward_features, the base model still only runs once
+    :return: list of predictions (1 = fake, 0 = real), output of shape
+    [len(images), num_classes] (and features of shape [len(images), dim] if
+    return_features is set)
+    """
+    timer = timer if timer is not None else StageTimer()
+
+    # Preprocess on cpu and cast the whole batch at once
+    with timer.measure('preprocess'):
+        if preprocessor is not None:
+            batch = preprocessor(images)
+        else:
+            batch = torch.cat([preprocess_image(image, cuda=False)
+                               for image in images])
+        if cuda:
+            batch = batch.cuda()
+        if profile is not None:
+            batch = profile.prepare(batch)
+
+    # Model prediction, the result is copied to cpu within the measurement
+    # to wait for cuda
+    with timer.measure('forward'):
+        autocast = profile.autocast() if profile is not None \
+            else contextlib.suppress()
+        with inference_mode(), autocast:
+            if return_features:
+                features = model.forward_features(batch)
+                output = model.classify_features(features)
+            else:
+                output = model(batch)
+        output = post_function(output.float())
+
+        # Cast to desired
+        _, prediction = torch.max(output, 1)    # argmax
+        prediction = [int(p) for p in prediction.cpu().numpy()]
+
+    if return_features:
+        return prediction, output, features.float().cpu()
+    return prediction, output
+
+
+def annotate_frame(image, face, prediction, output):
+    """
+    Draws the face bounding box and the network output onto the image.
+    :param image: numpy image in opencv form, modified in place
+    :param face: dlib face class
+    :param prediction: prediction (1 = fake, 0 = real)
+    :param output: network output of shape [num_classes]
+    """
+    # Text variables
+    font_face = cv2.FONT_HERSHEY_SIMPLEX
+    thickness = 2
+    font_scale = 1
+
+    # Text and bb
+    x = face.left()
+    y = face.top()
+    w = face.right() - x
+    h = face.bottom() - y
+    label = 'fake' if prediction == 1 else 'real'
+    color = (0, 255, 0) if prediction == 0 else (0, 0, 255)
+    output_list = ['{0:.2f}'.format(float(x)) for x in
+                   output.detach().cpu().numpy()]
+    cv2.putText(image, str(output_list)+'=>'+label, (x, y+h+30),
+                font_face, font_scale,
+                color, thickness, 2)
+    # draw box over face
+    cv2.rectangle(image, (x, y), (x + w, y + h), color, 2)
+
+
+class VideoDetector(object):
+    """
+    Holds the classification network and the dlib face detector so that they
+    are only created once and can be reused to score an arbitrary number of
+    videos.
+    """
+    def __init__(self, model_path=None, modelname='xception', cuda=True,
+                 batch_size=1, headless=False, sampler=None, detect_every=1,
+                 track_confidence=7.0, detection_size=None, upsample=1,
+                 pipeline=False, queue_size=16, fast_preprocessing=False,
+                 timing=False, profile=None, feature_cache=None,
+                 tta_scales=None, tta_flip=False, tta_reduction='mean',
+                 early_stop=None):
+        """
+        :param model_path: path to model file (checkpoint, TorchScript or
+        pickled model), if None a model with random final layer is used
+        :param modelname: network architecture, see model_selection, None
+        only loads the face detector (e.g., for face_crops)
+        :param cuda: enable cuda
+        :param batch_size: number of face crops, taken from consecutive
+        frames, that are evaluated with a single forward pass (times the
+        number of test-time augmented views)
+        :param headless: only compute scores, i.e., skip drawing, displaying
+        and writing of the output video
+        :param sampler: video.sampling.FrameSampler that selects the
+        evaluated frames, defaults to all frames
+        :param detect_every: run the face detector only every detect_every
+        evaluated frames and track the face in between
+        :param track_confidence: minimum tracking confidence, a new detection
+        is triggered if the confidence drops below this value
+        :param detection_size: run the face detector on a copy of the frame
+        whose longer side is scaled down to detection_size pixels, None uses
+        the full resolution
+        :param upsample: number of times the image is upsampled by the dlib
+        face detector to find smaller faces
+        :param pipeline: run decoding and face detection in background
+        threads that are connected by bounded queues
+        :param queue_size: maximum number of frames per pipeline queue
+        :param fast_preprocessing: preprocess face crops with OpenCV/numpy
+        instead of PIL/torchvision, see dataset.transform.BatchPreprocessor
+        :param timing: print per-stage timings (decode, detect, crop,
+        preprocess, forward, write) after every video
+        :param profile: network.inference_profile.InferenceProfile with
+        memory format, threading and autocast settings for the model
+        :param feature_cache: optional dataset.feature_cache.FeatureCache,
+        stores the base model features of every evaluated frame
+        :param tta_scales: test-time augmentation, list of bounding box
+        scales (see get_boundingbox), defaults to [1.3]
+        :param tta_flip: test-time augmentation, additionally evaluate the
+        horizontally flipped crops
+        :param tta_reduction: reduction of the outputs of all views of a
+        frame, 'mean' or 'max' (view with the highest fake probability)
+        :param early_stop: optional video.aggregate.SequentialTest, decoding
+        stops as soon as the test reaches a verdict
+        """
+        self.cuda = cuda
+        self.batch_size = batch_size
+        self.headless = headless
+        self.sampler = sampler if sampler is not None else FrameSampler()
+        self.detect_every = detect_every
+        self.track_confidence = track_confidence
+        self.detection_size = detection_size
+        self.upsample = upsample
+        self.pipeline = pipeline
+        self.queue_size = queue_size
+        self.timing = timing
+        self.feature_cache = feature_cache
+        self.tta_scales = tta_scales or [1.3]
+        self.tta_flip = tta_flip
+        self.tta_reduction = tta_reduction
+        self.num_views = len(self.tta_scales) * (2 if tta_flip else 1)
+        self.early_stop = early_stop
+        # Stage timings of the last scored video
+        self.timer = None
+
+        # Face detector
+        self.face_detector = dlib.get_frontal_face_detector()
+
+        # Load model
+        self.model, self.model_info = None, None
+        if modelname is not None:
+            self.model, self.model_info = load_model(model_path, modelname,
+                                                     cuda=cuda)
+        if feature_cache is not None and self.model is not None and \
+                not hasattr(self.model, 'forward_features'):
+            # E.g., TorchScript models, only forward is exported
+            raise Exception('Wrong model for the feature cache, {} has no '
+                            'forward_features'.format(model_path))
+        self.profile = profile
+        if profile is not None and self.model is not None:
+            self.model = profile.apply(self.model)
+
+        self.preprocessor = None
+        if fast_preprocessing and self.model is not None:
+            self.preprocessor = BatchPreprocessor(
+                self.model_info['image_size'], self.model_info['mean'],
+                self.model_info['std'], batch_size=batch_size)
+
+    def detect_face(self, image):
+        """
+        Detects the biggest face in an image. If a detection size is set,
+        detection runs on a downscaled copy and the box is mapped back to the
+        original image coordinates.
+        :param image: numpy image in opencv form
+        :return: dlib face class or None if no face was found
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        height, width = gray.shape[:2]
+        scale = 1.0
+        if self.detection_size and max(height, width) > self.detection_size:
+            scale = self.detection_size / max(height, width)
+            gray = cv2.resize(gray, (int(width * scale), int(height * scale)),
+                              interpolation=cv2.INTER_AREA)
+        faces = self.face_detector(gray, self.upsample)
+        if len(faces):
+            # For now only take biggest face
+            face = faces[0]
+            if scale != 1.0:
+                face = dlib.rectangle(int(face.left() / scale),
+                                      int(face.top() / scale),
+                                      int(face.right() / scale),
+                                      int(face.bottom() / scale))
+            return face
+        return None
+
+    def _detect_frames(self, frames, tracker, video_name, timer):
+        """
+        Detection stage: finds the face in every frame and crops it.
+        :param frames: iterable of (frame_num, image)
+        :param tracker: video.tracking.FaceTracker of the current video
+        :param video_name: name used in the records
+        :param timer: video.pipeline.StageTimer
+        :return: generator of (record, image, face, views) tuples, views is
+        the list of test-time augmented face crops (the first one is the plain
+        crop of the first scale), record, face and views are None if no face
+        was found in the image
+        """
+        for frame_num, image in frames:
+            # 2. Detect with dlib or track from the last detection
+            with timer.measure('detect'):
+                face = tracker(image)
+            record, views = None, None
+            if face is not None:
+                # Face crop with dlib and bounding box scale enlargement
+                with timer.measure('crop'):
+                    height, width = image.shape[:2]
+                    views = []
+                    for scale in self.tta_scales:
+                        x, y, size = get_boundingbox(face, width, height,
+                                                     scale=scale)
+                        crop = image[y:y+size, x:x+size]
+                        views.append(crop)
+                        if self.tta_flip:
+                            views.append(cv2.flip(crop, 1))
+                        if record is None:
+                            record = {'video': video_name, 'frame': frame_num,
+                                      'x': x, 'y': y, 'size': size}
+            yield record, image, face, views
+
+    def _reduce_views(self, output):
+        """
+        Reduces the outputs of all test-time augmented views of a frame.
+        :param output: output of shape [num_frames * num_views, num_classes]
+        :return: list of predictions, output of shape [num_frames,
+        num_classes]
+        """
+        output = output.view(-1, self.num_views, output.shape[1])
+        if self.tta_reduction == 'mean':
+            output = output.mean(1)
+        else:
+            # View with the highest fake probability
+            view = output[:, :, 1].argmax(1)
+            output = output[torch.arange(output.shape[0]), view]
+        _, prediction = torch.max(output, 1)    # argmax
+        return [int(p) for p in prediction.cpu().numpy()], output
+
+    def _write_frames(self, frames, writer, timer, record_writer=None,
+                      features=None):
+        """
+        Evaluates all buffered face crops with one forward pass, annotates the
+        buffered frames and shows/writes them in their original order.
+        :param frames: list of (record, image, face, views) tuples, see
+        _detect_frames. All views of all frames are evaluated in one batch
+        and reduced per frame
+        :param writer: opencv video writer, None in headless mode
+        :param timer: video.pipeline.StageTimer
+        :param record_writer: optional writer that receives the records
+        :param features: optional list, the base model features of all
+        frames with a face are appended
+        :return: list of records for all frames with a face
+        """
+        records = []
+        crops = [view for _, _, face, views in frames if face is not None
+                 for view in views]
+        if crops:
+            result = predict_batch_with_model(
+                crops, self.model, cuda=self.cuda,
+                preprocessor=self.preprocessor, timer=timer,
+                profile=self.profile, return_features=features is not None)
+            predictions, outputs = result[:2] if self.num_views == 1 else \
+                self._reduce_views(result[1])
+            if features is not None:
+                # Features of the plain crop of every frame
+                features.append(result[2][::self.num_views])
+            i = 0
+            for record, image, face, _ in frames:
+                if face is None:
+                    continue
+                record['fake_prob'] = float(outputs[i][1])
+                records.append(record)
+                if record_writer is not None:
+                    record_writer.write(record)
+                if not self.headless:
+                    annotate_frame(image, face, predictions[i], outputs[i])
+                i += 1
+
+        if not self.headless:
+            for _, image, _, _ in frames:
+                # Show, not measured as it waits
+                cv2.imshow('test', image)
+                cv2.waitKey(33)     # About 30 fps
+                with timer.measure('write'):
+                    writer.write(image)
+        return records
+
+    def face_crops(self, video_path, start_frame=0, end_frame=None):
+        """
+        Detects and crops the face in the sampled frames of a video without
+        evaluating the network.
+        :param video_path: path to video file
+        :param start_frame: first frame (counting from 0)
+        :param end_frame: frame after the last frame
+        :return: generator of (record, crop) for all frames with a face,
+        records contain video, frame, x, y and size
+        """
+        video_name = os.path.basename(video_path).split('.')[0]
+        reader = cv2.VideoCapture(video_path)
+        num_frames = int(reader.get(cv2.CAP_PROP_FRAME_COUNT))
+        end_frame = min(end_frame, num_frames) if end_frame else num_frames
+        frame_numbers = self.sampler.frame_numbers(video_path, start_frame,
+                                                   end_frame)
+        tracker = FaceTracker(self.detect_face, self.detect_every,
+                              self.track_confidence)
+        frames = self.sampler.read_frames(reader, frame_numbers)
+        try:
+            for record, _, face, views in self._detect_frames(
+                    frames, tracker, video_name, StageTimer()):
+                if face is not None:
+                    yield record, views[0]
+        finally:
+            reader.release()
+
+    def score_video(self, video_path, output_path='.', start_frame=0,
+                    end_frame=None, record_writer=None):
+        """
+        Reads a video and evaluates a subset of frames with the detection
+        network. Outputs are only given if a face is present and the face is
+        highlighted using dlib.
+        :param video_path: path to video file
+        :param output_path: path where the output video is stored, unused in
+        headless mode
+        :param start_frame: first frame to evaluate (counting from 0)
+        :param end_frame: frame after the last frame to evaluate
+        :param record_writer: optional writer that receives the record of
+        every evaluated frame, see video.records
+        :return: list of records (video, frame, x, y, size, fake_prob) for all
+        evaluated frames with a face
+        """
+        print('Starting: {}'.format(video_path))
+        video_name = os.path.basename(video_path).split('.')[0]
+
+        # Read and write
+        reader = cv2.VideoCapture(video_path)
+        num_frames = int(reader.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = reader.get(cv2.CAP_PROP_FPS)
+        writer = None
+
+        # Frame numbers and length of output video
+        assert start_frame < num_frames - 1
+        end_frame = min(end_frame, num_frames) if end_frame else num_frames
+        frame_numbers = self.sampler.frame_numbers(video_path, start_frame,
+                                                   end_frame)
+        pbar = tqdm(total=len(frame_numbers))
+        tracker = FaceTracker(self.detect_face, self.detect_every,
+                              self.track_confidence)
+
+        # Decoding -> detection -> classification, in pipeline mode decoding
+        # and detection run in their own threads
+        timer = StageTimer()
+        stages = []
+        frames = timer.timed(self.sampler.read_frames(reader, frame_numbers),
+                             'decode')
+        if self.pipeline:
+            frames = BackgroundIterator(frames, self.queue_size, 'decode')
+            stages.append(frames)
+        detections = self._detect_frames(frames, tracker, video_name, timer)
+        if self.pipeline:
+            detections = BackgroundIterator(detections, self.queue_size,
+                                            'detect')
+            stages.append(detections)
+
+        # Frames are buffered until batch_size frames have been collected,
+        # in headless mode only the face crops of frames with a face are kept
+        frames = []
+        records = []
+        features = [] if self.feature_cache is not None else None
+        if self.early_stop is not None:
+            self.early_stop.reset()
+        try:
+            for detection in detections:
+                pbar.update(1)
+                image = detection[1]
+
+                # Init output writer
+                if writer is None and not self.headless:
+                    height, width = image.shape[:2]
+                    os.makedirs(output_path, exist_ok=True)
+                    fourcc = cv2.VideoWriter_fourcc(*'MJPG')
+                    writer = cv2.VideoWriter(
+                        join(output_path, video_name + '.avi'), fourcc, fps,
+                        (height, width)[::-1])
+
+                if self.headless:
+                    if detection[2] is None:
+                        continue
+                    # Copy the crops so that they do not keep the frame
+                    detection = (detection[0], None, detection[2],
+                                 [view.copy() for view in detection[3]])
+                frames.append(detection)
+
+                # --- Prediction -----------------------------------------------
+                if len(frames) >= self.batch_size:
+                    new_records = self._write_frames(frames, writer, timer,
+                                                     record_writer, features)
+                    records += new_records
+                    frames = []
+                    if self.early_stop is not None and self.early_stop.update(
+                            [r['fake_prob'] for r in new_records]):
+                        break
+            if frames:
+                records += self._write_frames(frames, writer, timer,
+                                              record_writer, features)
+        finally:
+            # Consumers first, so that no stage waits for a closed producer
+            for stage in reversed(stages):
+                stage.close()
+        pbar.close()
+        reader.release()
+
+        if self.early_stop is not None and self.early_stop.verdict:
+            print('Early stop, verdict {} after {} of {} frames'.format(
+                self.early_stop.verdict, pbar.n, len(frame_numbers)))
+        if features:
+            self.feature_cache.write(video_name,
+                                     [r['frame'] for r in records],
+                                     torch.cat(features))
+        self.timer = timer
+        if self.timing:
+            print(timer.report())
+        if self.pipeline:
+            for stage in stages:
+                print(stage.summary())
+        if writer is not None:
+            writer.release()
+            print('Finished! Output saved under {}'.format(output_path))
+        elif pbar.n == 0:
+            print('Input video file was empty')
+        return records
+
+
 def test_full_image_network(video_path, model_path, output_path,
-                            start_frame=0, end_frame=None, cuda=True):
+                            start_frame=0, end_frame=None, cuda=True,
+                            batch_size=1):
     """
     Reads a video and evaluates a subset of frames with the a detection network
     that takes in a full frame. Outputs are only given if a face is present
     and the face is highlighted using dlib.
+    Note: loads the model for every call, use VideoDetector to evaluate
+    multiple videos.
     :param video_path: path to video file
     :param model_path: path to model file (should expect the full sized image)
     :param output_path: path where the output video is stored
-    :param start_frame: first frame to evaluate
-    :param end_frame: last frame to evaluate
+    :param start_frame: first frame to evaluate (counting from 0)
+    :param end_frame: frame after the last frame to evaluate
     :param cuda: enable cuda
+    :param batch_size: number of face crops, taken from consecutive frames,
+    that are evaluated with a single forward pass
     :return:
     """
-    print('Starting: {}'.format(video_path))
-
-    # Read and write
-    reader = cv2.VideoCapture(video_path)
+    detector = VideoDetector(model_path, cuda=cuda, batch_size=batch_size)
+    return detector.score_video(video_path, output_path,
+                                start_frame=start_frame, end_frame=end_frame)
 
-    video_fn = video_path.split('/')[-1].split('.')[0]+'.avi'
-    os.makedirs(output_path, exist_ok=True)
-    fourcc = cv2.VideoWriter_fourcc(*'MJPG')
-    fps = reader.get(cv2.CAP_PROP_FPS)
-    num_frames = int(reader.get(cv2.CAP_PROP_FRAME_COUNT))
-    writer = None
 
-    # Face detector
-    face_detector = dlib.get_frontal_face_detector()
-
-    # Load model
-    model, *_ = model_selection(modelname='xception', num_out_classes=2)
-    if model_path is not None:
-        model = torch.load(model_path)
-        print('Model found in {}'.format(model_path))
-    else:
-        print('No model found, initializing random model.')
-    if cuda:
-        model = model.cuda()
+# Detector of a scoring worker process, created once by _init_worker
+_worker_detector = None
 
-    # Text variables
-    font_face = cv2.FONT_HERSHEY_SIMPLEX
-    thickness = 2
-    font_scale = 1
 
-    # Frame numbers and length of output video
-    frame_num = 0
-    assert start_frame < num_frames - 1
-    end_frame = end_frame if end_frame else num_frames
-    pbar = tqdm(total=end_frame-start_frame)
+def _init_worker(detector_kwargs, num_threads):
+    global _worker_detector
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    _worker_detector = VideoDetector(**detector_kwargs)
 
-    while reader.isOpened():
-        _, image = reader.read()
-        if image is None:
-            break
-        frame_num += 1
 
-        if frame_num < start_frame:
-            continue
-        pbar.update(1)
+def _score_worker(job):
+    video_path, output_path, start_frame, end_frame = job
+    records = _worker_detector.score_video(video_path, output_path,
+                                           start_frame=start_frame,
+                                           end_frame=end_frame)
+    return video_path, records
 
-        # Image size
-        height, width = image.shape[:2]
 
-        # Init output writer
-        if writer is None:
-            writer = cv2.VideoWriter(join(output_path, video_fn), fourcc, fps,
-                                     (height, width)[::-1])
-
-        # 2. Detect with dlib
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        faces = face_detector(gray, 1)
-        if len(faces):
-            # For now only take biggest face
-            face = faces[0]
-
-            # --- Prediction ---------------------------------------------------
-            # Face crop with dlib and bounding box scale enlargement
-            x, y, size = get_boundingbox(face, width, height)
-            cropped_face = image[y:y+size, x:x+size]
-
-            # Actual prediction using our model
-            prediction, output = predict_with_model(cropped_face, model,
-                                                    cuda=cuda)
-            # ------------------------------------------------------------------
-
-            # Text and bb
-            x = face.left()
-            y = face.top()
-            w = face.right() - x
-            h = face.bottom() - y
-            label = 'fake' if prediction == 1 else 'real'
-            color = (0, 255, 0) if prediction == 0 else (0, 0, 255)
-            output_list = ['{0:.2f}'.format(float(x)) for x in
-                           output.detach().cpu().numpy()[0]]
-            cv2.putText(image, str(output_list)+'=>'+label, (x, y+h+30),
-                        font_face, font_scale,
-                        color, thickness, 2)
-            # draw box over face
-            cv2.rectangle(image, (x, y), (x + w, y + h), color, 2)
-
-        if frame_num >= end_frame:
-            break
-
-        # Show
-        cv2.imshow('test', image)
-        cv2.waitKey(33)     # About 30 fps
-        writer.write(image)
-    pbar.close()
-    if writer is not None:
-        writer.release()
-        print('Finished! Output saved under {}'.format(output_path))
-    else:
-        print('Input video file was empty')
+def score_videos(videos, detector_kwargs, output_path='.', start_frame=0,
+                 end_frame=None, workers=1, num_threads=None):
+    """
+    Scores a list of videos, optionally distributed over a pool of worker
+    processes. Every worker holds its own VideoDetector.
+    :param videos: list of video paths
+    :param detector_kwargs: keyword arguments of VideoDetector
+    :param output_path: see VideoDetector.score_video
+    :param start_frame: see VideoDetector.score_video
+    :param end_frame: see VideoDetector.score_video
+    :param workers: number of worker processes, 1 scores in this process
+    :param num_threads: number of intra-op torch threads per worker, defaults
+    to the number of cpus divided by the number of workers
+    :return: generator of (video_path, records) in order of completion
+    """
+    jobs = [(video, output_path, start_frame, end_frame) for video in videos]
+    if workers <= 1:
+        _init_worker(detector_kwargs, num_threads)
+        for job in jobs:
+            yield _score_worker(job)
+        return
+
+    if num_threads is None:
+        num_threads = max(1, multiprocessing.cpu_count() // workers)
+    # Forking a process with an initialized torch/cuda runtime is unsafe
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers, initializer=_init_worker,
+                      initargs=(detector_kwargs, num_threads)) as pool:
+        for result in pool.imap_unordered(_score_worker, jobs):
+            yield result
 
 
 if __name__ == '__main__':
@@ -227,13 +659,151 @@ if __name__ == '__main__':
     p.add_argument('--start_frame', type=int, default=0)
     p.add_argument('--end_frame', type=int, default=None)
     p.add_argument('--cuda', action='store_true')
+    p.add_argument('--batch_size', '-b', type=int, default=1,
+                   help='Number of face crops evaluated per forward pass')
+    p.add_argument('--headless', action='store_true',
+                   help='Only compute scores, no display or output video')
+    p.add_argument('--records_path', type=str, default=None,
+                   help='Output file for per-frame records, defaults to '
+                        '<output_path>/scores.jsonl in headless mode')
+    p.add_argument('--records_format', type=str, choices=RECORD_FORMATS,
+                   default=None,
+                   help='Record format, inferred from extension if not set')
+    p.add_argument('--sampling', type=str, choices=SAMPLING_POLICIES,
+                   default='all', help='Which frames to evaluate')
+    p.add_argument('--stride', type=int, default=1,
+                   help='Step size of the stride sampling policy')
+    p.add_argument('--num_samples', type=int, default=32,
+                   help='Number of frames of the uniform sampling policy')
+    p.add_argument('--seek_threshold', type=int, default=None,
+                   help='Seek in the container instead of skipping frames '
+                        'if more than this many frames are skipped')
+    p.add_argument('--aggregate', type=str, choices=AGGREGATION_METHODS,
+                   default='mean',
+                   help='Aggregation of frame scores to a video score')
+    p.add_argument('--top_k', type=int, default=5,
+                   help='Number of frames of the topk aggregation')
+    p.add_argument('--detect_every', type=int, default=1,
+                   help='Run the face detector every n evaluated frames and '
+                        'track the face in between')
+    p.add_argument('--track_confidence', type=float, default=7.0,
+                   help='Minimum tracking confidence before re-detecting')
+    p.add_argument('--detection_size', type=int, default=None,
+                   help='Longer image side used for face detection, frames '
+                        'are downscaled to this size before detection')
+    p.add_argument('--upsample', type=int, default=1,
+                   help='Number of upsampling steps of the face detector')
+    p.add_argument('--pipeline', action='store_true',
+                   help='Decode, detect and classify in concurrent threads')
+    p.add_argument('--queue_size', type=int, default=16,
+                   help='Maximum number of frames per pipeline queue')
+    p.add_argument('--fast_preprocessing', action='store_true',
+                   help='Preprocess face crops with OpenCV instead of PIL')
+    p.add_argument('--timing', action='store_true',
+                   help='Print per-stage timings after every video')
+    p.add_argument('--channels_last', action='store_true',
+                   help='Run the model in channels_last memory format')
+    p.add_argument('--num_threads', type=int, default=None,
+                   help='Torch intra-op threads, overrides '
+                        '--threads_per_worker')
+    p.add_argument('--num_interop_threads', type=int, default=None,
+                   help='Torch inter-op threads')
+    p.add_argument('--bfloat16', action='store_true',
+                   help='bfloat16 autocast on cpus that support it')
+    p.add_argument('--feature_cache', type=str, default=None,
+                   help='Folder where the base model features of all '
+                        'evaluated frames are cached')
+    p.add_argument('--tta_scales', type=float, nargs='+', default=None,
+                   help='Test-time augmentation: bounding box scales, '
+                        'e.g., 1.2 1.3 1.4')
+    p.add_argument('--tta_flip', action='store_true',
+                   help='Test-time augmentation: horizontal flip')
+    p.add_argument('--tta_reduction', type=str, default='mean',
+                   choices=['mean', 'max'],
+                   help='Reduction of the outputs of all augmented views')
+    p.add_argument('--early_stop', action='store_true',
+                   help='Stop scoring a video as soon as a sequential '
+                        'probability ratio test on the frame scores decides')
+    p.add_argument('--early_stop_margin', type=float, default=0.2,
+                   help='Fraction of fake frames of the hypotheses is '
+                        '0.5 +- margin')
+    p.add_argument('--early_stop_error', type=float, default=0.01,
+                   help='Error rate of the sequential test')
+    p.add_argument('--early_stop_min_frames', type=int, default=8,
+                   help='Minimum number of evaluated frames')
+    p.add_argument('--workers', type=int, default=1,
+                   help='Number of worker processes, each with its own model')
+    p.add_argument('--threads_per_worker', type=int, default=None,
+                   help='Torch intra-op threads per worker, defaults to '
+                        '#cpus / #workers')
+    p.add_argument('--results_path', type=str, default=None,
+                   help='Json file with the video scores of all videos, '
+                        'defaults to <output_path>/results.json in headless '
+                        'mode')
     args = p.parse_args()
 
+    sampler = FrameSampler(args.sampling, stride=args.stride,
+                           num_samples=args.num_samples,
+                           seek_threshold=args.seek_threshold)
+    detector_kwargs = dict(model_path=args.model_path, cuda=args.cuda,
+                           batch_size=args.batch_size,
+                           headless=args.headless, sampler=sampler,
+                           detect_every=args.detect_every,
+                           track_confidence=args.track_confidence,
+                           detection_size=args.detection_size,
+                           upsample=args.upsample,
+                           pipeline=args.pipeline,
+                           queue_size=args.queue_size,
+                           fast_preprocessing=args.fast_preprocessing,
+                           timing=args.timing,
+                           profile=InferenceProfile(
+                               args.channels_last, args.num_threads,
+                               args.num_interop_threads, args.bfloat16),
+                           feature_cache=FeatureCache(args.feature_cache)
+                           if args.feature_cache else None,
+                           tta_scales=args.tta_scales,
+                           tta_flip=args.tta_flip,
+                           tta_reduction=args.tta_reduction,
+                           early_stop=SequentialTest(
+                               margin=args.early_stop_margin,
+                               alpha=args.early_stop_error,
+                               beta=args.early_stop_error,
+                               min_frames=args.early_stop_min_frames)
+                           if args.early_stop else None)
+    records_path = args.records_path
+    results_path = args.results_path
+    if args.headless:
+        if records_path is None:
+            records_path = join(args.output_path, 'scores.jsonl')
+        if results_path is None:
+            results_path = join(args.output_path, 'results.json')
+    record_writer = None
+    if records_path is not None:
+        record_writer = open_record_writer(records_path, args.records_format)
     video_path = args.video_path
     if video_path.endswith('.mp4') or video_path.endswith('.avi'):
-        test_full_image_network(**vars(args))
+        videos = [video_path]
     else:
-        videos = os.listdir(video_path)
-        for video in videos:
-            args.video_path = join(video_path, video)
-            test_full_image_network(**vars(args))
+        videos = [join(video_path, video) for video in os.listdir(video_path)]
+
+    results = {}
+    for video, records in score_videos(videos, detector_kwargs,
+                                       args.output_path,
+                                       start_frame=args.start_frame,
+                                       end_frame=args.end_frame,
+                                       workers=args.workers,
+                                       num_threads=args.threads_per_worker):
+        if record_writer is not None:
+            for record in records:
+                record_writer.write(record)
+        video_score = aggregate_scores([r['fake_prob'] for r in records],
+                                       args.aggregate, args.top_k)
+        print('Video score of {}: {}'.format(video, video_score))
+        results[os.path.basename(video).split('.')[0]] = {
+            'score': video_score, 'num_frames': len(records)}
+    if record_writer is not None:
+        record_writer.close()
+    if results_path is not None:
+        with open(results_path, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+        print('Results saved under {}'.format(results_path))
@@ -0,0 +1,81 @@
+"""
+Compares the accuracy and throughput of a model and its cpu optimized
+variant (batch norm folding and int8 quantization, see
+network/quantization.py) on a held-out split of FaceForensics++.
+
+Usage:
+python evaluate_optimized_model.py
+    -i <FaceForensics++ root folder>
+    -m <path to model file>
+    --split <path to dataset/splits/test.json>
+
+Author: Andreas Rössler
+"""
+import argparse
+import numpy as np
+from tqdm import tqdm
+
+from detect_from_video import VideoDetector, predict_batch_with_model
+from dataset.splits import split_videos, video_path, METHODS, \
+    COMPRESSION
+from network.quantization import optimize_for_cpu
+from video.sampling import FrameSampler
+from video.pipeline import StageTimer
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument('--data_path', '-i', type=str, required=True)
+    p.add_argument('--model_path', '-mi', type=str, default=None)
+    p.add_argument('--split', type=str, default='../dataset/splits/test.json')
+    p.add_argument('--compression', '-c', type=str, default='c23',
+                   choices=COMPRESSION)
+    p.add_argument('--methods', type=str, nargs='+',
+                   default=METHODS)
+    p.add_argument('--num_samples', type=int, default=16,
+                   help='Number of uniformly sampled frames per video')
+    p.add_argument('--batch_size', type=int, default=16)
+    p.add_argument('--no_fuse', action='store_true')
+    p.add_argument('--no_quantize', action='store_true')
+    args = p.parse_args()
+
+    detector = VideoDetector(args.model_path, cuda=False, headless=True,
+                             sampler=FrameSampler('uniform',
+                                                  num_samples=args.num_samples))
+    models = {'eager': detector.model,
+              'optimized': optimize_for_cpu(detector.model,
+                                            fuse=not args.no_fuse,
+                                            quantize=not args.no_quantize)}
+    timers = {name: StageTimer() for name in models}
+    correct = {name: 0 for name in models}
+    num_videos = 0
+    num_crops = 0
+    agreement = 0
+
+    for dataset, name, label in tqdm(split_videos(args.split, args.methods)):
+        path = video_path(args.data_path, dataset, args.compression, name)
+        crops = [crop for _, crop in detector.face_crops(path)]
+        if not crops:
+            tqdm.write('No face found in {}'.format(path))
+            continue
+        num_videos += 1
+        num_crops += len(crops)
+        predictions = {}
+        for model_name, model in models.items():
+            fake_probs = []
+            for i in range(0, len(crops), args.batch_size):
+                _, output = predict_batch_with_model(
+                    crops[i:i + args.batch_size], model, cuda=False,
+                    timer=timers[model_name])
+                fake_probs += output[:, 1].tolist()
+            predictions[model_name] = int(np.mean(fake_probs) > 0.5)
+            correct[model_name] += int(predictions[model_name] == label)
+        agreement += int(predictions['eager'] == predictions['optimized'])
+
+    for model_name, timer in timers.items():
+        print('{}: accuracy {:.4f}, {:.2f} images/sec'.format(
+            model_name, correct[model_name] / max(num_videos, 1),
+            num_crops / max(timer.total('forward'), 1e-9)))
+    print('Agreement of video predictions: {:.4f} ({} videos)'.format(
+        agreement / max(num_videos, 1), num_videos))
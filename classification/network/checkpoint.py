@@ -0,0 +1,138 @@
+"""
+Checkpoint format that stores the state dict of a model together with the
+information that is needed to rebuild and run it (model name, number of
+classes, input size and normalization) instead of a pickled module. Such
+checkpoints load across code versions and, with torch>=2.1, are memory
+mapped so that multiple worker processes share the read-only weights.
+
+Usage (from the classification folder), converts a pickled model:
+python -m network.checkpoint
+    -m <path to pickled model file>
+    -o <path to output checkpoint>
+
+Author: Andreas Rössler
+"""
+import os
+import inspect
+import zipfile
+import argparse
+import torch
+
+from network.models import model_selection, MODEL_IMAGE_SIZES
+from network.export import is_torchscript, load_torchscript
+
+
+CHECKPOINT_FORMAT = 'faceforensics_checkpoint'
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(model, output_path, modelname, image_size,
+                    mean=(0.5, 0.5, 0.5), std=(0.5, 0.5, 0.5)):
+    """
+    :param model: TransferModel
+    :param output_path: path of the checkpoint
+    :param modelname: model name as used in model_selection
+    :param image_size: input image size
+    :param mean: per channel normalization mean of the input
+    :param std: per channel normalization standard deviation of the input
+    """
+    state_dict = {name: tensor.cpu()
+                  for name, tensor in model.state_dict().items()}
+    num_out_classes = [t for n, t in state_dict.items()
+                       if n.endswith('weight')][-1].shape[0]
+    checkpoint = {
+        'format': CHECKPOINT_FORMAT,
+        'version': CHECKPOINT_VERSION,
+        'modelname': modelname,
+        'num_out_classes': int(num_out_classes),
+        'image_size': image_size,
+        'mean': list(mean),
+        'std': list(std),
+        'state_dict': state_dict,
+    }
+    # Write to a temporary file first so that no partial checkpoint is left
+    torch.save(checkpoint, output_path + '.tmp')
+    os.replace(output_path + '.tmp', output_path)
+
+
+def _torch_load(model_path, mmap):
+    """torch.load with memory mapping where the installed torch version
+    supports it. Full unpickling stays enabled for pickled modules."""
+    parameters = inspect.signature(torch.load).parameters
+    kwargs = {'map_location': 'cpu'}
+    # Legacy (non-zipfile) pickles, e.g., the released models saved with
+    # torch 1.0, can not be memory mapped
+    if mmap and 'mmap' in parameters and zipfile.is_zipfile(model_path):
+        kwargs['mmap'] = True
+    if 'weights_only' in parameters:
+        kwargs['weights_only'] = False
+    return torch.load(model_path, **kwargs)
+
+
+def is_checkpoint(obj):
+    return isinstance(obj, dict) and obj.get('format') == CHECKPOINT_FORMAT
+
+
+def load_checkpoint(checkpoint):
+    """
+    Builds the model of a loaded checkpoint without loading any pretrained
+    weights.
+    :param checkpoint: checkpoint dict
+    :return: model in eval mode
+    """
+    model, *_ = model_selection(checkpoint['modelname'],
+                                checkpoint['num_out_classes'],
+                                pretrained=False)
+    if 'assign' in inspect.signature(model.load_state_dict).parameters:
+        # Keep the (memory mapped) tensors instead of copying them
+        model.load_state_dict(checkpoint['state_dict'], assign=True)
+    else:
+        model.load_state_dict(checkpoint['state_dict'])
+    return model.eval()
+
+
+def load_model(model_path=None, modelname='xception', cuda=False,
+               mmap=True):
+    """
+    Loads a model from a checkpoint, a TorchScript file or a pickled module.
+    :param model_path: path to model file, if None an imagenet pretrained
+    model with a random final layer is created
+    :param modelname: model name, only used for pickled modules or if no
+    model path is given
+    :param cuda: move the model to cuda
+    :param mmap: memory map checkpoint weights (torch>=2.1), ignored for cuda
+    and legacy (non-zipfile) files
+    :return: model in eval mode, dict with modelname, image_size, mean, std
+    """
+    info = {'modelname': modelname, 'image_size': MODEL_IMAGE_SIZES[modelname],
+            'mean': [0.5] * 3, 'std': [0.5] * 3}
+    if model_path is None:
+        print('No model found, initializing random model.')
+        model, *_ = model_selection(modelname, num_out_classes=2)
+    elif is_torchscript(model_path):
+        print('TorchScript model found in {}'.format(model_path))
+        model = load_torchscript(model_path, cuda=cuda)
+    else:
+        print('Model found in {}'.format(model_path))
+        model = _torch_load(model_path, mmap=mmap and not cuda)
+        if is_checkpoint(model):
+            info = {key: model[key] for key in info}
+            model = load_checkpoint(model)
+    if cuda:
+        model = model.cuda()
+    return model.eval(), info
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument('--model_path', '-m', type=str, required=True)
+    p.add_argument('--modelname', type=str, default='xception',
+                   choices=['xception', 'resnet18'])
+    p.add_argument('--output_path', '-o', type=str, required=True)
+    args = p.parse_args()
+
+    model, info = load_model(args.model_path, args.modelname, mmap=False)
+    save_checkpoint(model, args.output_path, info['modelname'],
+                    info['image_size'], info['mean'], info['std'])
+    print('Saved checkpoint under {}'.format(args.output_path))
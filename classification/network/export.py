@@ -0,0 +1,112 @@
+"""
+Exports a trained TransferModel to a standalone TorchScript file that can be
+loaded without the model code and compares it against the eager model.
+
+Usage (from the classification folder):
+python -m network.export
+    -m <path to model file, imagenet model if not given>
+    -o <path to output TorchScript file>
+
+Author: Andreas Rössler
+"""
+import time
+import zipfile
+import argparse
+import torch
+
+
+def inference_mode():
+    """torch.inference_mode if available (torch>=1.9), else torch.no_grad"""
+    if hasattr(torch, 'inference_mode'):
+        return torch.inference_mode()
+    return torch.no_grad()
+
+
+def export_torchscript(model, output_path, image_size=299, method='trace'):
+    """
+    Converts a model to TorchScript and saves it.
+    :param model: torch model in eval mode
+    :param output_path: path of the TorchScript file
+    :param image_size: input image size used for tracing
+    :param method: 'trace' or 'script'
+    :return: TorchScript module
+    """
+    model = model.cpu().eval()
+    if method == 'trace':
+        example = torch.rand(1, 3, image_size, image_size)
+        with torch.no_grad():
+            scripted = torch.jit.trace(model, example)
+    elif method == 'script':
+        scripted = torch.jit.script(model)
+    else:
+        raise Exception('Wrong export method: {}'.format(method))
+    if hasattr(torch.jit, 'freeze'):
+        # Inlines parameters and attributes as constants
+        scripted = torch.jit.freeze(scripted)
+    torch.jit.save(scripted, output_path)
+    return scripted
+
+
+def is_torchscript(model_path):
+    """TorchScript archives contain the serialized model code."""
+    if not zipfile.is_zipfile(model_path):
+        return False
+    with zipfile.ZipFile(model_path) as f:
+        return any('/code/' in name for name in f.namelist())
+
+
+def load_torchscript(model_path, cuda=False):
+    model = torch.jit.load(model_path,
+                           map_location='cuda' if cuda else 'cpu')
+    model.eval()
+    return model
+
+
+def compare(model, scripted, image_size=299, batch_size=8, iterations=10):
+    """
+    Prints the maximum output difference and the throughput of the eager and
+    the TorchScript model.
+    """
+    batch = torch.rand(batch_size, 3, image_size, image_size)
+    with inference_mode():
+        difference = (model(batch) - scripted(batch)).abs().max()
+        print('Max output difference: {:.6f}'.format(float(difference)))
+        for name, m in [('eager', model), ('torchscript', scripted)]:
+            # Warm up, TorchScript optimizes during the first calls
+            for _ in range(2):
+                m(batch)
+            start = time.perf_counter()
+            for _ in range(iterations):
+                m(batch)
+            elapsed = time.perf_counter() - start
+            print('{}: {:.2f} images/sec'.format(
+                name, batch_size * iterations / elapsed))
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument('--model_path', '-m', type=str, default=None)
+    p.add_argument('--modelname', type=str, default='xception',
+                   choices=['xception', 'resnet18'])
+    p.add_argument('--output_path', '-o', type=str, required=True)
+    p.add_argument('--method', type=str, default='trace',
+                   choices=['trace', 'script'])
+    p.add_argument('--batch_size', type=int, default=8)
+    p.add_argument('--iterations', type=int, default=10)
+    args = p.parse_args()
+
+    # Imported here as network.checkpoint depends on this module
+    from network.checkpoint import load_model
+    start = time.perf_counter()
+    model, info = load_model(args.model_path, args.modelname)
+    image_size = info['image_size']
+    print('Eager startup: {:.2f}s'.format(time.perf_counter() - start))
+
+    export_torchscript(model, args.output_path, image_size, args.method)
+    start = time.perf_counter()
+    scripted = load_torchscript(args.output_path)
+    print('TorchScript startup: {:.2f}s'.format(time.perf_counter() - start))
+    print('Saved TorchScript model under {}'.format(args.output_path))
+
+    compare(model, scripted, image_size, args.batch_size, args.iterations)
@@ -0,0 +1,79 @@
+"""
+Cpu inference settings for the models of model_selection: channels_last
+memory format, torch thread counts and bfloat16 autocast.
+
+Author: Andreas Rössler
+"""
+import contextlib
+import torch
+
+
+def cpu_supports_bfloat16():
+    """Checks for native bfloat16 instructions (avx512_bf16 or amx)."""
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            flags = f.read()
+    except IOError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+class InferenceProfile(object):
+    """
+    Applies inference settings to a model and its input batches.
+    """
+    def __init__(self, channels_last=False, num_threads=None,
+                 num_interop_threads=None, bfloat16=False):
+        """
+        :param channels_last: convert model and inputs to the channels_last
+        (NHWC) memory format, which is faster for the depthwise separable
+        convolutions of xception with mkldnn, ignored for torch<1.5
+        :param num_threads: number of intra-op threads, None keeps the torch
+        default
+        :param num_interop_threads: number of inter-op threads, only has an
+        effect before the first parallel torch operation, ignored for
+        torch<1.2
+        :param bfloat16: run the model under bfloat16 autocast, ignored if
+        the cpu does not support bfloat16 natively
+        """
+        self.channels_last = channels_last and \
+            hasattr(torch, 'channels_last')
+        if channels_last and not self.channels_last:
+            print('channels_last requires torch>=1.5, found {}, using the '
+                  'default memory format.'.format(torch.__version__))
+        self.num_threads = num_threads
+        self.num_interop_threads = num_interop_threads
+        self.bfloat16 = bfloat16 and hasattr(torch, 'autocast') and \
+            cpu_supports_bfloat16()
+        if bfloat16 and not self.bfloat16:
+            print('bfloat16 is not supported on this cpu, using float32.')
+
+    def apply(self, model):
+        """Sets the torch threads and converts the model."""
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        if self.num_interop_threads and \
+                not hasattr(torch, 'set_num_interop_threads'):
+            print('Inter-op threads require torch>=1.2, found {}.'.format(
+                torch.__version__))
+        elif self.num_interop_threads:
+            try:
+                torch.set_num_interop_threads(self.num_interop_threads)
+            except RuntimeError:
+                print('Inter-op threads can only be set before torch starts '
+                      'parallel work, keeping {}.'.format(
+                          torch.get_num_interop_threads()))
+        if self.channels_last:
+            model = model.to(memory_format=torch.channels_last)
+        return model
+
+    def prepare(self, batch):
+        """Converts an input batch to the memory format of the model."""
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        return batch
+
+    def autocast(self):
+        if self.bfloat16:
+            return torch.autocast('cpu', dtype=torch.bfloat16)
+        return contextlib.suppress()
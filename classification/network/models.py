@@ -4,32 +4,84 @@ Author: Andreas Rössler
 """
 import os
 import argparse
+import tempfile
 
 
 import torch
 import pretrainedmodels
 import torch.nn as nn
 import torch.nn.functional as F
-from network.xception import xception
+import torch.utils.model_zoo as model_zoo
+from network.xception import xception, pretrained_settings
 import math
 import torchvision
 
 
-def return_pytorch04_xception(pretrained=True):
+# Directory of the imagenet xception weights, can be set with the
+# FACEFORENSICS_WEIGHTS_DIR environment variable
+WEIGHTS_DIR = os.environ.get(
+    'FACEFORENSICS_WEIGHTS_DIR',
+    os.path.join(os.path.expanduser('~'), '.torch', 'models'))
+XCEPTION_WEIGHTS = 'xception-b5690688.pth'
+# Weights converted to torch 0.4+, i.e., reshaped pointwise convolutions and
+# last_linear instead of fc
+XCEPTION_CONVERTED_WEIGHTS = 'xception-b5690688-pytorch04.pth'
+
+
+def xception_imagenet_state_dict(weights_dir=None):
+    """
+    Returns the imagenet xception weights converted to torch 0.4+. The
+    conversion is done once and cached in weights_dir. The original weights
+    are taken from weights_dir and only downloaded if they are missing there,
+    so copying xception-b5690688.pth to weights_dir is sufficient on machines
+    without internet access.
+    :param weights_dir: weight cache directory, defaults to WEIGHTS_DIR
+    :return: state dict of network.xception.Xception
+    """
+    weights_dir = weights_dir or WEIGHTS_DIR
+    converted_path = os.path.join(weights_dir, XCEPTION_CONVERTED_WEIGHTS)
+    if os.path.exists(converted_path):
+        return torch.load(converted_path, map_location='cpu')
+
+    original_path = os.path.join(weights_dir, XCEPTION_WEIGHTS)
+    if os.path.exists(original_path):
+        state_dict = torch.load(original_path, map_location='cpu')
+    else:
+        state_dict = model_zoo.load_url(
+            pretrained_settings['xception']['imagenet']['url'],
+            model_dir=weights_dir, map_location='cpu')
+    converted = {}
+    for name, weights in state_dict.items():
+        if 'pointwise' in name:
+            weights = weights.unsqueeze(-1).unsqueeze(-1)
+        if name.startswith('fc.'):
+            name = 'last_linear.' + name[len('fc.'):]
+        converted[name] = weights
+
+    # Unique temporary file, worker processes may convert concurrently
+    os.makedirs(weights_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=weights_dir)
+    os.close(fd)
+    try:
+        torch.save(converted, tmp_path)
+        os.replace(tmp_path, converted_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return converted
+
+
+def return_pytorch04_xception(pretrained=True, weights_dir=None):
+    """
+    :param pretrained: load the imagenet weights
+    :param weights_dir: weight cache directory, see
+    xception_imagenet_state_dict
+    """
     # Raises warning "src not broadcastable to dst" but thats fine
     model = xception(pretrained=False)
     if pretrained:
         # Load model in torch 0.4+
-        model.fc = model.last_linear
-        del model.last_linear
-        state_dict = torch.load(
-            '/home/ondyari/.torch/models/xception-b5690688.pth')
-        for name, weights in state_dict.items():
-            if 'pointwise' in name:
-                state_dict[name] = weights.unsqueeze(-1).unsqueeze(-1)
-        model.load_state_dict(state_dict)
-        model.last_linear = model.fc
-        del model.fc
+        model.load_state_dict(xception_imagenet_state_dict(weights_dir))
     return model
 
 
@@ -38,11 +90,12 @@ class TransferModel(nn.Module):
     Simple transfer learning model that takes an imagenet pretrained model with
     a fc layer as base model and retrains a new fc layer for num_out_classes
     """
-    def __init__(self, modelchoice, num_out_classes=2, dropout=0.0):
+    def __init__(self, modelchoice, num_out_classes=2, dropout=0.0,
+                 pretrained=True):
         super(TransferModel, self).__init__()
         self.modelchoice = modelchoice
         if modelchoice == 'xception':
-            self.model = return_pytorch04_xception()
+            self.model = return_pytorch04_xception(pretrained)
             # Replace fc
             num_ftrs = self.model.last_linear.in_features
             if not dropout:
@@ -55,9 +108,9 @@ class TransferModel(nn.Module):
                 )
         elif modelchoice == 'resnet50' or modelchoice == 'resnet18':
             if modelchoice == 'resnet50':
-                self.model = torchvision.models.resnet50(pretrained=True)
+                self.model = torchvision.models.resnet50(pretrained=pretrained)
             if modelchoice == 'resnet18':
-                self.model = torchvision.models.resnet18(pretrained=True)
+                self.model = torchvision.models.resnet18(pretrained=pretrained)
             # Replace fc
             num_ftrs = self.model.fc.in_features
             if not dropout:
@@ -114,21 +167,56 @@ class TransferModel(nn.Module):
         x = self.model(x)
         return x
 
+    def forward_features(self, x):
+        """
+        Returns the pooled features of the base model in front of the final
+        layer, i.e., 2048-d for xception and 512-d for resnet18.
+        forward(x) == classify_features(forward_features(x))
+        """
+        if self.modelchoice == 'xception':
+            x = self.model.features(x)
+            x = self.model.relu(x)
+            x = F.adaptive_avg_pool2d(x, (1, 1))
+        else:
+            for name, child in self.model.named_children():
+                if name == 'fc':
+                    break
+                x = child(x)
+        return x.view(x.size(0), -1)
+
+    def classify_features(self, features):
+        """Applies the final layer to features of forward_features."""
+        if self.modelchoice == 'xception':
+            return self.model.last_linear(features)
+        return self.model.fc(features)
+
+
+# Input image size of the models of model_selection
+MODEL_IMAGE_SIZES = {
+    'xception': 299,
+    'resnet18': 224,
+}
+
 
 def model_selection(modelname, num_out_classes,
-                    dropout=None):
+                    dropout=None, pretrained=True):
     """
     :param modelname:
+    :param pretrained: load imagenet weights, disable if the weights are
+    loaded from a checkpoint anyway
     :return: model, image size, pretraining<yes/no>, input_list
     """
     if modelname == 'xception':
         return TransferModel(modelchoice='xception',
-                             num_out_classes=num_out_classes), 299, \
+                             num_out_classes=num_out_classes,
+                             pretrained=pretrained), \
+               MODEL_IMAGE_SIZES['xception'], \
                True, ['image'], None
     elif modelname == 'resnet18':
         return TransferModel(modelchoice='resnet18', dropout=dropout,
-                             num_out_classes=num_out_classes), \
-               224, True, ['image'], None
+                             num_out_classes=num_out_classes,
+                             pretrained=pretrained), \
+               MODEL_IMAGE_SIZES['resnet18'], True, ['image'], None
     else:
         raise NotImplementedError(modelname)
 
@@ -0,0 +1,91 @@
+"""
+CPU optimized variant of the xception TransferModel: all convolutions are
+fused with their following batch norm layer and the linear layers are
+dynamically quantized to int8. Requires torch>=1.3 (batch norm fusion and
+dynamic quantization), the pinned torch 1.0 is not supported.
+
+Author: Andreas Rössler
+"""
+import copy
+import torch
+import torch.nn as nn
+try:
+    from torch.nn.utils.fusion import fuse_conv_bn_eval
+except ImportError:
+    # torch<1.3
+    fuse_conv_bn_eval = None
+
+from network.xception import SeparableConv2d
+
+
+def _fuse(conv, bn):
+    """Folds bn into conv, for separable convolutions into the pointwise
+    convolution which is directly followed by the batch norm."""
+    if isinstance(conv, SeparableConv2d):
+        conv.pointwise = fuse_conv_bn_eval(conv.pointwise, bn)
+        return conv
+    return fuse_conv_bn_eval(conv, bn)
+
+
+def fuse_xception(model):
+    """
+    Folds all batch norm layers of an xception network (in eval mode) into
+    the preceding convolutions. The batch norm layers are replaced by
+    identities, so the module structure and state dict names of the
+    convolutions are kept.
+    :param model: network.xception.Xception
+    :return: fused model (modified in place)
+    """
+    if fuse_conv_bn_eval is None or not hasattr(nn, 'Identity'):
+        raise Exception('Wrong torch version for batch norm fusion: {}, '
+                        'requires torch>=1.3'.format(torch.__version__))
+    model.eval()
+    for conv_name, bn_name in [('conv1', 'bn1'), ('conv2', 'bn2'),
+                               ('conv3', 'bn3'), ('conv4', 'bn4')]:
+        setattr(model, conv_name, _fuse(getattr(model, conv_name),
+                                        getattr(model, bn_name)))
+        setattr(model, bn_name, nn.Identity())
+
+    for block in [m for m in model.modules() if hasattr(m, 'rep')]:
+        if block.skip is not None:
+            block.skip = _fuse(block.skip, block.skipbn)
+            block.skipbn = nn.Identity()
+        layers = list(block.rep)
+        for i in range(len(layers) - 1):
+            if isinstance(layers[i], SeparableConv2d) and \
+                    isinstance(layers[i + 1], nn.BatchNorm2d):
+                layers[i] = _fuse(layers[i], layers[i + 1])
+                layers[i + 1] = nn.Identity()
+        block.rep = nn.Sequential(*layers)
+    return model
+
+
+def quantize_linear(model):
+    """Dynamic int8 quantization of all linear layers, i.e., last_linear"""
+    if not hasattr(torch, 'quantization') or \
+            not hasattr(torch.quantization, 'quantize_dynamic'):
+        raise Exception('Wrong torch version for dynamic quantization: {}, '
+                        'requires torch>=1.3'.format(torch.__version__))
+    return torch.quantization.quantize_dynamic(model, {nn.Linear},
+                                               dtype=torch.qint8)
+
+
+def optimize_for_cpu(model, fuse=True, quantize=True):
+    """
+    Creates the cpu optimized variant of a TransferModel or Xception model.
+    Static quantization of the convolutions is not supported as the residual
+    additions of the xception blocks are not quantization aware.
+    :param model: TransferModel('xception') or Xception
+    :param fuse: fold batch norms into convolutions
+    :param quantize: dynamic int8 quantization of the linear layers
+    :return: optimized copy of the model in eval mode
+    """
+    model = copy.deepcopy(model).cpu().eval()
+    if fuse:
+        xception = model.model if hasattr(model, 'modelchoice') else model
+        if hasattr(model, 'modelchoice') and model.modelchoice != 'xception':
+            raise Exception('Fusion is only implemented for xception')
+        fuse_xception(xception)
+    if quantize:
+        model = quantize_linear(model)
+    return model
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Modules of classification/ are imported relative to that folder, as in the
+# scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,17 @@
+from video.aggregate import aggregate_scores, SequentialTest
+
+
+def test_sequential_test_verdicts():
+    test = SequentialTest(min_frames=8)
+    assert test.update([0.9] * 4) is None
+    assert test.update([0.9] * 4) == 'fake'
+    test.reset()
+    assert test.update([0.1] * 8) == 'real'
+    test.reset()
+    assert test.update([0.9, 0.1] * 50) is None
+
+
+def test_aggregate_scores():
+    assert abs(aggregate_scores([0.2, 0.4]) - 0.3) < 1e-6
+    assert aggregate_scores([]) is None
+
@@ -0,0 +1,70 @@
+import time
+import threading
+
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('cv2')
+pytest.importorskip('dlib')
+
+from benchmark import SyntheticFaceDetector, make_synthetic_video
+from video.aggregate import SequentialTest
+from video.sampling import FrameSampler
+
+
+NUM_FRAMES = 64
+
+
+class FakeModel(torch.nn.Module):
+    """Classifies every face crop as fake"""
+    def forward(self, x):
+        return torch.tensor([[0., 5.]]).repeat(x.shape[0], 1)
+
+
+class SlowSampler(FrameSampler):
+    """Decoding slower than detection, i.e., the detection thread of the
+    pipeline waits for frames"""
+    def read_frames(self, reader, frame_numbers):
+        for frame in super(SlowSampler, self).read_frames(reader,
+                                                          frame_numbers):
+            time.sleep(0.2)
+            yield frame
+
+
+@pytest.fixture(scope='module')
+def video_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('video').joinpath('synthetic.avi'))
+    make_synthetic_video(path, NUM_FRAMES, width=320, height=240)
+    return path
+
+
+def _score(video_path, **kwargs):
+    """Scores the video in a thread, returns None if scoring does not finish
+    within the timeout (e.g., a deadlocked pipeline)."""
+    detector = SyntheticFaceDetector(modelname=None, cuda=False,
+                                     headless=True, batch_size=4, **kwargs)
+    detector.model = FakeModel().eval()
+    result = []
+    thread = threading.Thread(
+        target=lambda: result.append(detector.score_video(video_path)),
+        daemon=True)
+    thread.start()
+    thread.join(60)
+    return (result[0] if result else None), detector
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+@pytest.mark.parametrize('sampler', [FrameSampler, SlowSampler])
+def test_early_stop(video_path, pipeline, sampler):
+    records, detector = _score(
+        video_path, pipeline=pipeline, queue_size=2, sampler=sampler(),
+        early_stop=SequentialTest(min_frames=8))
+    assert records is not None
+    assert detector.early_stop.verdict == 'fake'
+    assert 8 <= len(records) < NUM_FRAMES
+
+
+def test_pipeline_scores_all_frames(video_path):
+    records, _ = _score(video_path, pipeline=True, queue_size=2)
+    assert [r['frame'] for r in records] == list(range(NUM_FRAMES))
+    assert all(r['fake_prob'] > 0.5 for r in records)
@@ -0,0 +1,60 @@
+import time
+import threading
+
+from video.pipeline import BackgroundIterator
+
+
+def _slow_range(n, delay=0.05):
+    for i in range(n):
+        time.sleep(delay)
+        yield i
+
+
+def _chain():
+    """decode -> detect, as in VideoDetector.score_video with pipeline"""
+    decode = BackgroundIterator(_slow_range(1000), 2, 'decode')
+    detect = BackgroundIterator((i * 2 for i in decode), 2, 'detect')
+    return decode, detect
+
+
+def _closes(stages, timeout=5):
+    """Closes the stages in the given order, returns False if closing does
+    not finish within timeout."""
+    closer = threading.Thread(
+        target=lambda: [stage.close() for stage in stages], daemon=True)
+    closer.start()
+    closer.join(timeout)
+    return not closer.is_alive()
+
+
+def test_items():
+    stage = BackgroundIterator(range(5), 2)
+    assert list(stage) == list(range(5))
+    stage.close()
+
+
+def test_early_exit_close_consumer_first():
+    decode, detect = _chain()
+    for _ in detect:
+        break
+    assert _closes([detect, decode])
+
+
+def test_early_exit_close_producer_first():
+    decode, detect = _chain()
+    for _ in detect:
+        break
+    assert _closes([decode, detect])
+
+
+def test_exception():
+    def failing():
+        yield 1
+        raise ValueError('decode failed')
+    stage = BackgroundIterator(failing(), 2)
+    try:
+        list(stage)
+        assert False
+    except ValueError:
+        pass
+    stage.close()
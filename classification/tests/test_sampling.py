@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip('cv2')
+
+from video import sampling
+
+
+def _keyframes(monkeypatch, output):
+    monkeypatch.setattr(sampling.subprocess, 'check_output',
+                        lambda *args, **kwargs: output.encode())
+    return sampling.keyframe_numbers('video.mp4')
+
+
+def test_keyframes_display_order(monkeypatch):
+    # B-frames: decoding order differs from display order
+    output = '0,K__\n3,___\n1,___\n2,___\n4,K__\n'
+    assert _keyframes(monkeypatch, output) == [0, 4]
+
+
+def test_keyframes_without_pts(monkeypatch):
+    # Missing time stamps, the decoding order is used for all packets
+    output = '0,K__\nN/A,___\n5,___\nN/A,K__\n'
+    assert _keyframes(monkeypatch, output) == [0, 3]
+
+
+def test_keyframes_skips_malformed_lines(monkeypatch):
+    output = '0,K__\n\n1,___,\nside data\n2,K__\n'
+    assert _keyframes(monkeypatch, output) == [0, 2]
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+pil_image = pytest.importorskip('PIL.Image')
+
+from dataset.transform import BatchPreprocessor, \
+    xception_default_data_transforms
+
+
+# Normalized inputs are in [-1, 1], i.e., one intensity level is 2 / 255
+LEVEL = 2. / 255
+# Resizing uses OpenCV instead of PIL interpolation
+MAX_ABS_TOLERANCE = 12 * LEVEL
+MEAN_ABS_TOLERANCE = 2 * LEVEL
+
+
+def _face_like_image(rng, size):
+    """Smooth random image, faces do not contain pixel noise"""
+    image = rng.randint(0, 256, (size // 8, size // 8, 3)).astype(np.uint8)
+    return cv2.resize(image, (size, size), interpolation=cv2.INTER_CUBIC)
+
+
+def _expected(image):
+    return xception_default_data_transforms['test'](
+        pil_image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
+
+
+@pytest.mark.parametrize('size', [120, 200, 299, 480, 640])
+def test_parity_with_torchvision(size):
+    image = _face_like_image(np.random.RandomState(size), size)
+    difference = (_expected(image) - BatchPreprocessor()([image])[0]).abs()
+    assert float(difference.max()) <= MAX_ABS_TOLERANCE
+    assert float(difference.mean()) <= MEAN_ABS_TOLERANCE
+
+
+def test_no_resize_is_exact():
+    image = _face_like_image(np.random.RandomState(0), 299)
+    actual = BatchPreprocessor()([image])[0]
+    assert float((_expected(image) - actual).abs().max()) <= 1e-5
+
+
+def test_batch():
+    rng = np.random.RandomState(0)
+    images = [_face_like_image(rng, size) for size in [120, 299, 480]]
+    preprocessor = BatchPreprocessor(batch_size=1)
+    batch = preprocessor(images)
+    assert tuple(batch.shape) == (3, 3, 299, 299)
+    for image, actual in zip(images, batch):
+        difference = (_expected(image) - actual).abs()
+        assert float(difference.mean()) <= MEAN_ABS_TOLERANCE
@@ -0,0 +1,79 @@
+"""
+Aggregation of frame-level fake probabilities to a video-level score.
+
+Author: Andreas Rössler
+"""
+import numpy as np
+
+
+AGGREGATION_METHODS = ['mean', 'median', 'topk']
+
+
+def aggregate_scores(fake_probs, method='mean', top_k=5):
+    """
+    :param fake_probs: list of frame fake probabilities
+    :param method: one of AGGREGATION_METHODS, topk averages the top_k
+    highest probabilities
+    :param top_k: number of frames used for the topk method
+    :return: video fake probability, None if no frame was evaluated
+    """
+    if len(fake_probs) == 0:
+        return None
+    fake_probs = np.asarray(fake_probs, dtype=np.float64)
+    if method == 'mean':
+        return float(fake_probs.mean())
+    elif method == 'median':
+        return float(np.median(fake_probs))
+    elif method == 'topk':
+        return float(np.sort(fake_probs)[-top_k:].mean())
+    else:
+        raise Exception('Wrong aggregation method: {}'.format(method))
+
+
+class SequentialTest(object):
+    """
+    Wald's sequential probability ratio test for early stopping of the video
+    scoring. Every frame counts as a fake vote if its fake probability is
+    above threshold. The test decides between H0: the fraction of fake votes
+    is 0.5 - margin (real video) and H1: it is 0.5 + margin (fake video)
+    with error rates alpha and beta. Note that consecutive frames are not
+    independent, so the actual error rates are higher than alpha and beta.
+    """
+    def __init__(self, threshold=0.5, margin=0.2, alpha=0.01, beta=0.01,
+                 min_frames=8):
+        """
+        :param threshold: fake probability above which a frame votes fake
+        :param margin: distance of the hypotheses from 0.5
+        :param alpha: probability of deciding fake for a real video
+        :param beta: probability of deciding real for a fake video
+        :param min_frames: minimum number of frames before stopping
+        """
+        self.threshold = threshold
+        self.min_frames = min_frames
+        p0, p1 = 0.5 - margin, 0.5 + margin
+        self.fake_step = np.log(p1 / p0)
+        self.real_step = np.log((1 - p1) / (1 - p0))
+        self.upper = np.log((1 - beta) / alpha)
+        self.lower = np.log(beta / (1 - alpha))
+        self.reset()
+
+    def reset(self):
+        self.llr = 0.
+        self.num_frames = 0
+        self.verdict = None
+
+    def update(self, fake_probs):
+        """
+        :param fake_probs: fake probabilities of the next frames
+        :return: verdict, 'fake', 'real' or None if undecided
+        """
+        for fake_prob in fake_probs:
+            self.num_frames += 1
+            self.llr += self.fake_step if fake_prob > self.threshold \
+                else self.real_step
+        if self.num_frames >= self.min_frames:
+            if self.llr >= self.upper:
+                self.verdict = 'fake'
+            elif self.llr <= self.lower:
+                self.verdict = 'real'
+        return self.verdict
@@ -0,0 +1,144 @@
+"""
+Building blocks to run the stages of the video scoring (decoding, face
+detection, classification) concurrently. OpenCV, dlib and torch release the
+GIL, so the stages overlap when they run in separate threads.
+
+Author: Andreas Rössler
+"""
+import time
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+
+
+class StageTimer(object):
+    """
+    Records the duration of every call of named stages. Every stage should
+    only be measured from one thread.
+    """
+    def __init__(self):
+        self.durations = OrderedDict()
+
+    def add(self, stage, seconds):
+        self.durations.setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def timed(self, iterable, stage):
+        """Wraps an iterator and measures the time of every next() call."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.add(stage, time.perf_counter() - start)
+            yield item
+
+    def total(self, stage):
+        return float(np.sum(self.durations.get(stage, [])))
+
+    def percentile(self, stage, q):
+        """:return: q-th percentile of the call durations of stage in ms"""
+        return 1000 * float(np.percentile(self.durations[stage], q))
+
+    def merge(self, other):
+        for stage, durations in other.durations.items():
+            self.durations.setdefault(stage, []).extend(durations)
+
+    def summary(self):
+        return ', '.join(
+            '{}: {:.2f}s ({:.1f}ms/call)'.format(
+                stage, self.total(stage), 1000 * np.mean(durations))
+            for stage, durations in self.durations.items())
+
+    def report(self):
+        """:return: table with calls, total time, p50 and p95 per stage"""
+        lines = ['{:<12}{:>8}{:>10}{:>10}{:>10}'.format(
+            'stage', 'calls', 'total s', 'p50 ms', 'p95 ms')]
+        for stage, durations in self.durations.items():
+            lines.append('{:<12}{:>8}{:>10.2f}{:>10.2f}{:>10.2f}'.format(
+                stage, len(durations), self.total(stage),
+                self.percentile(stage, 50), self.percentile(stage, 95)))
+        return '\n'.join(lines)
+
+
+class BackgroundIterator(object):
+    """
+    Consumes an iterator in a background thread and hands its items over
+    through a bounded queue, so that the producer can only run queue_size
+    items ahead of the consumer.
+    """
+    _done = object()
+
+    def __init__(self, iterable, queue_size=8, name=None):
+        self.iterable = iterable
+        self.name = name
+        self.queue = queue.Queue(queue_size)
+        self.stopped = threading.Event()
+        self.exception = None
+        # Queue depth statistics, sampled whenever an item is taken
+        self.max_depth = 0
+        self.depth_sum = 0
+        self.num_items = 0
+        self.thread = threading.Thread(target=self._run, name=name,
+                                       daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            for item in self.iterable:
+                if not self._put(item):
+                    return
+        except Exception as e:
+            self.exception = e
+        self._put(self._done)
+
+    def __iter__(self):
+        while True:
+            depth = self.queue.qsize()
+            # Poll so that a consumer, e.g., the thread of a downstream
+            # stage, is not blocked forever once this stage is closed
+            try:
+                item = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.stopped.is_set():
+                    return
+                continue
+            if item is self._done:
+                if self.exception is not None:
+                    raise self.exception
+                return
+            self.max_depth = max(self.max_depth, depth)
+            self.depth_sum += depth
+            self.num_items += 1
+            yield item
+
+    def close(self):
+        """Stops the producer thread, e.g., if the consumer stops early.
+        Chained stages should be closed starting with the last one."""
+        self.stopped.set()
+        self.thread.join()
+
+    def summary(self):
+        mean_depth = self.depth_sum / max(self.num_items, 1)
+        return '{} queue: mean depth {:.1f}, max depth {}/{}'.format(
+            self.name, mean_depth, self.max_depth, self.queue.maxsize)
@@ -0,0 +1,81 @@
+"""
+Writers for per-frame detection records, i.e., the frame number, the face
+bounding box and the fake probability of every evaluated frame.
+
+Author: Andreas Rössler
+"""
+import os
+import csv
+import json
+import numpy as np
+
+
+RECORD_FIELDS = ['video', 'frame', 'x', 'y', 'size', 'fake_prob']
+RECORD_FORMATS = ['jsonl', 'csv', 'npy']
+
+
+class JsonlRecordWriter(object):
+    """Streams one json object per line."""
+    def __init__(self, path):
+        self.file = open(path, 'w')
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class CsvRecordWriter(object):
+    """Streams records as csv rows with a header line."""
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=RECORD_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, record):
+        self.writer.writerow(record)
+
+    def close(self):
+        self.file.close()
+
+
+class NumpyRecordWriter(object):
+    """Collects all records and saves them as a numpy structured array once
+    the writer is closed."""
+    def __init__(self, path):
+        self.path = path
+        self.records = []
+
+    def write(self, record):
+        self.records.append(tuple(record[field] for field in RECORD_FIELDS))
+
+    def close(self):
+        max_len = max([len(r[0]) for r in self.records] + [1])
+        dtype = [('video', 'U{}'.format(max_len)), ('frame', np.int32),
+                 ('x', np.int32), ('y', np.int32), ('size', np.int32),
+                 ('fake_prob', np.float32)]
+        np.save(self.path, np.array(self.records, dtype=dtype))
+
+
+def open_record_writer(path, record_format=None):
+    """
+    Opens a record writer for the given path.
+    :param path: output file
+    :param record_format: one of RECORD_FORMATS, if None the format is
+    inferred from the file extension
+    :return: record writer with write(record) and close() methods
+    """
+    if record_format is None:
+        record_format = os.path.splitext(path)[1][1:]
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    if record_format == 'jsonl':
+        return JsonlRecordWriter(path)
+    elif record_format == 'csv':
+        return CsvRecordWriter(path)
+    elif record_format == 'npy':
+        return NumpyRecordWriter(path)
+    else:
+        raise Exception('Wrong record format: {}'.format(record_format))
@@ -0,0 +1,106 @@
+"""
+Frame sampling policies for video-level scoring. Frames that are not sampled
+are skipped with grab() (no decoding into an image) or by seeking in the
+container.
+
+Author: Andreas Rössler
+"""
+import subprocess
+import numpy as np
+import cv2
+
+
+SAMPLING_POLICIES = ['all', 'stride', 'uniform', 'keyframes']
+
+
+def keyframe_numbers(video_path):
+    """
+    Returns the (display order) frame numbers of all keyframes of a video
+    using ffprobe. Only the packet headers are read, no frame is decoded.
+    :param video_path: path to video file
+    :return: sorted list of frame numbers
+    """
+    # Demuxer messages on stderr must not end up in the parsed output
+    output = subprocess.check_output(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+         '-show_entries', 'packet=pts,flags', '-of', 'csv=p=0', video_path],
+        stderr=subprocess.DEVNULL).decode()
+    packets = []
+    for line in output.splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 2:
+            continue
+        packets.append((fields[0], 'K' in fields[1]))
+    # Packets are stored in decoding order, the display order is given by
+    # the presentation time stamp. Without time stamps for all packets, the
+    # decoding order is used for the whole stream
+    if all(pts.lstrip('-').isdigit() for pts, _ in packets):
+        packets.sort(key=lambda packet: int(packet[0]))
+    return [frame_num for frame_num, (_, key) in enumerate(packets) if key]
+
+
+class FrameSampler(object):
+    """
+    Selects the frames of a video that should be evaluated.
+    """
+    def __init__(self, policy='all', stride=1, num_samples=32,
+                 seek_threshold=None):
+        """
+        :param policy: one of SAMPLING_POLICIES
+            - all: every frame
+            - stride: every stride-th frame
+            - uniform: num_samples uniformly spaced frames
+            - keyframes: keyframes only (requires ffprobe)
+        :param stride: step size for the stride policy
+        :param num_samples: number of frames for the uniform policy
+        :param seek_threshold: seek in the container instead of grabbing
+        frames if more than seek_threshold frames are skipped. Seeking is not
+        frame accurate for all codecs, None disables seeking
+        """
+        if policy not in SAMPLING_POLICIES:
+            raise Exception('Wrong sampling policy: {}'.format(policy))
+        self.policy = policy
+        self.stride = stride
+        self.num_samples = num_samples
+        self.seek_threshold = seek_threshold
+
+    def frame_numbers(self, video_path, start_frame, end_frame):
+        """
+        :param video_path: path to video file
+        :param start_frame: first frame to evaluate
+        :param end_frame: frame after the last frame to evaluate
+        :return: sorted list of frame numbers in [start_frame, end_frame)
+        """
+        if self.policy == 'all':
+            return list(range(start_frame, end_frame))
+        elif self.policy == 'stride':
+            return list(range(start_frame, end_frame, self.stride))
+        elif self.policy == 'uniform':
+            num_samples = min(self.num_samples, end_frame - start_frame)
+            return sorted(set(np.linspace(start_frame, end_frame - 1,
+                                          num_samples).astype(int).tolist()))
+        else:
+            return [frame_num for frame_num in keyframe_numbers(video_path)
+                    if start_frame <= frame_num < end_frame]
+
+    def read_frames(self, reader, frame_numbers):
+        """
+        Decodes the requested frames of an opened video.
+        :param reader: cv2.VideoCapture positioned at the first frame
+        :param frame_numbers: sorted list of frame numbers
+        :return: generator of (frame_num, image)
+        """
+        position = 0
+        for frame_num in frame_numbers:
+            skip = frame_num - position
+            if self.seek_threshold is not None and skip > self.seek_threshold:
+                reader.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+            else:
+                for _ in range(skip):
+                    if not reader.grab():
+                        return
+            success, image = reader.read()
+            if not success:
+                return
+            position = frame_num + 1
+            yield frame_num, image
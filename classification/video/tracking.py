@@ -0,0 +1,61 @@
+"""
+Face tracking between face detections. The face detector only runs every
+few frames, in between the face bounding box is propagated with a dlib
+correlation tracker.
+
+Author: Andreas Rössler
+"""
+import dlib
+
+
+class FaceTracker(object):
+    """
+    Runs the face detector every detect_every frames and tracks the face box
+    in between. A new detection is triggered as soon as the tracking
+    confidence drops or the box drifts out of the image.
+    """
+    def __init__(self, detect_face, detect_every=1, min_confidence=7.0):
+        """
+        :param detect_face: function that takes an image and returns a dlib
+        rectangle or None
+        :param detect_every: run the face detector every detect_every frames,
+        1 disables tracking
+        :param min_confidence: minimum peak to side lobe ratio of the
+        correlation tracker, lower values trigger a new detection
+        """
+        self.detect_face = detect_face
+        self.detect_every = detect_every
+        self.min_confidence = min_confidence
+        self.tracker = None
+        self.frames_since_detection = 0
+
+    def _detect(self, image):
+        face = self.detect_face(image)
+        self.frames_since_detection = 0
+        if face is None or self.detect_every <= 1:
+            self.tracker = None
+        else:
+            self.tracker = dlib.correlation_tracker()
+            self.tracker.start_track(image, face)
+        return face
+
+    def __call__(self, image):
+        """
+        :param image: numpy image in opencv form, consecutive calls should
+        receive consecutive (or sampled) frames of one video
+        :return: dlib rectangle of the face or None if no face was found
+        """
+        self.frames_since_detection += 1
+        if self.tracker is None or \
+                self.frames_since_detection >= self.detect_every:
+            return self._detect(image)
+
+        confidence = self.tracker.update(image)
+        position = self.tracker.get_position()
+        height, width = image.shape[:2]
+        if confidence < self.min_confidence or position.right() <= 0 or \
+                position.bottom() <= 0 or position.left() >= width or \
+                position.top() >= height:
+            return self._detect(image)
+        return dlib.rectangle(int(position.left()), int(position.top()),
+                              int(position.right()), int(position.bottom()))
@@ -12,24 +12,69 @@ from tqdm import tqdm
 from os.path import join
 import json
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from manifest import JobManifest, temporary_path, commit_output, \
+    remove_output, count_video_frames, file_checksum
+from frame_store import extract_frames_to_store, num_stored_frames
 
-def extract_frames(data_path, output_path):
+
+def extract_frames(data_path, output_path, output_format='png',
+                   threads=None):
+    """Extracts all frames of a video as %04d.png images starting from 0 or
+    into a single npy frame store (see frame_store.py). Returns the number of
+    extracted frames. threads limits the decoding (and encoding) threads."""
+    if output_format == 'npy':
+        return extract_frames_to_store(data_path, output_path, threads)
+    elif output_format != 'png':
+        raise Exception('Wrong output format: {}'.format(output_format))
     os.makedirs(output_path, exist_ok=True)
-    subprocess.check_output('ffmpeg -i {} -start_number 0 {}'.format(
-        data_path, join(output_path, '%04d.png')),
+    # -threads is an input and an output option, i.e., limit both
+    threads = '-threads {} '.format(threads) if threads else ''
+    subprocess.check_output('ffmpeg {}-i {} {}-start_number 0 {}'.format(
+        threads, data_path, threads, join(output_path, '%04d.png')),
         shell=True, stderr=subprocess.STDOUT)
+    return len(os.listdir(output_path))
 
 
 def make_video_from_images(data_path, output_path,
-                           crf=0, fps=30):
+                           crf=0, fps=30, threads=None):
     # Video color space is different from RGB by default which we want to have
     # when converting loss-less
     codec = 'libx264' if crf != 0 else 'libx264rgb'
+    threads = '-threads {} '.format(threads) if threads else ''
     subprocess.check_output(
-        'ffmpeg -r {} -i {} -crf {} -c:v {} -vf "fps={}" {}'.format(
+        'ffmpeg -r {} -i {} -crf {} -c:v {} -vf "fps={}" {}{}'.format(
             str(fps), join(data_path, '%04d.png'), str(crf), codec, str(fps),
-            output_path),
+            threads, output_path),
+        shell=True, stderr=subprocess.STDOUT)
+
+
+def make_videos_from_images(data_path, output_paths, fps=30, threads=None):
+    """
+    Encodes an image sequence with multiple crfs with a single ffmpeg call,
+    i.e., the images are only read and decoded once and the decoded frames
+    are split to one encoder per crf.
+    :param data_path: folder with %04d.png images
+    :param output_paths: dict {crf: output video path}
+    :param fps: frame rate
+    :param threads: ffmpeg threads
+    """
+    crfs = sorted(output_paths.keys())
+    labels = ''.join('[v{}]'.format(crf) for crf in crfs)
+    # Output options, i.e., also -threads, only apply to the next output
+    threads = '-threads {} '.format(threads) if threads else ''
+    outputs = []
+    for crf in crfs:
+        # Video color space is different from RGB by default which we want
+        # to have when converting loss-less
+        codec = 'libx264' if crf != 0 else 'libx264rgb'
+        outputs.append('-map "[v{}]" -crf {} -c:v {} {}{}'.format(
+            crf, crf, codec, threads, output_paths[crf]))
+    subprocess.check_output(
+        'ffmpeg -r {} -i {} -filter_complex "fps={},split={}{}" {}'.format(
+            str(fps), join(data_path, '%04d.png'), str(fps), len(crfs),
+            labels, ' '.join(outputs)),
         shell=True, stderr=subprocess.STDOUT)
 
 
@@ -81,65 +126,229 @@ def compress_v1(data_path, output_path, crf, fps, **kwargs):
                                       crf=crf, fps=fps)
 
 
-def create_compressed_method(data_path, method='Face2Face',
-                             extract_images=True,
-                             **kwargs):
+def build_compression_jobs(data_path, methods, crfs=(0, 23, 40),
+                           single_pass=False, output_format='png'):
+    """
+    Builds the list of all (method, crf, sequence) compression jobs.
+    :param data_path: FaceForensics++ root folder
+    :param methods: list of methods, 'original' for the original sequences
+    :param crfs: constant rate factors
+    :param single_pass: create one job per (method, sequence) that encodes
+    all crfs from a single decode of the images
+    :param output_format: extracted frames of the compressed videos as png
+    images (<crf>/images/<sequence>) or npy frame stores
+    (<crf>/frames/<sequence>.npy)
+    :return: list of job dicts
+    """
     # 1. Extract fps for all files
     fps_dict = create_fps_dict(data_path)
 
-    # 2. Compress method folder
-    if method == 'original':
-        images_path = join(data_path, 'original_sequences', 'raw', 'images')
-        compressed_path = join(data_path, 'original_sequences')
+    jobs = []
+    for method in methods:
+        if method == 'original':
+            images_path = join(data_path, 'original_sequences', 'raw',
+                               'images')
+            compressed_path = join(data_path, 'original_sequences')
+        else:
+            images_path = join(data_path, 'manipulated_sequences', method,
+                               'raw', 'images')
+            compressed_path = join(data_path, 'manipulated_sequences', method)
+        folders = sorted(os.listdir(images_path))
+        crf_groups = [list(crfs)] if single_pass else [[crf] for crf in crfs]
+        for job_crfs in crf_groups:
+            for folder in folders:
+                if method == 'original':
+                    fps = fps_dict[folder]
+                else:
+                    # We take the fps of the source video for manipulated
+                    # videos
+                    fps = fps_dict[folder.split('_')[-1]]
+                jobs.append({
+                    'method': method, 'crfs': job_crfs, 'folder': folder,
+                    'fps': fps,
+                    'images_path': join(images_path, folder),
+                    'video_paths': {
+                        crf: join(compressed_path, 'c' + str(crf), 'videos',
+                                  folder + '.mp4') for crf in job_crfs},
+                    'images_output_paths': {
+                        crf: join(compressed_path, 'c' + str(crf), 'images',
+                                  folder) if output_format == 'png' else
+                        join(compressed_path, 'c' + str(crf), 'frames',
+                             folder + '.npy') for crf in job_crfs},
+                    'output_format': output_format,
+                })
+    return jobs
+
+
+def _job_name(job):
+    return '{} {} {}'.format(job['method'], ','.join(
+        'c' + str(crf) for crf in job['crfs']), job['folder'])
+
+
+def _video_is_complete(out_fn, num_in_frames, manifest):
+    """Checks the manifest, outputs that exist but are not recorded (e.g.,
+    from runs without manifest) are verified by their frame count."""
+    if manifest is not None and manifest.is_done(out_fn):
+        return True
+    if not os.path.exists(out_fn):
+        return False
+    num_frames = count_video_frames(out_fn)
+    if num_frames != num_in_frames:
+        return False
+    if manifest is not None:
+        manifest.record(out_fn, num_frames, file_checksum(out_fn))
+    return True
+
+
+def _images_are_complete(images_output_path, num_in_frames, manifest):
+    """Checks the manifest, image folders or frame stores that exist but are
+    not recorded (e.g., from runs without manifest) are verified by their
+    number of frames."""
+    if manifest is not None and manifest.is_done(images_output_path):
+        return True
+    if os.path.isfile(images_output_path):
+        num_frames = num_stored_frames(images_output_path)
+    elif os.path.isdir(images_output_path):
+        num_frames = len(os.listdir(images_output_path))
     else:
-        images_path = join(data_path, 'manipulated_sequences', method, 'raw',
-                           'images')
-        compressed_path = join(data_path, 'manipulated_sequences', method)
-
-    for crf in [0, 23, 40]:
-        print('Starting ', crf)
-        videos_output_path = join(compressed_path, 'c'+str(crf), 'videos')
-        images_output_path = join(compressed_path, 'c'+str(crf), 'images')
-        os.makedirs(videos_output_path, exist_ok=True)
-        if extract_images:
-            os.makedirs(images_output_path, exist_ok=True)
-
-        for folder in tqdm(sorted(os.listdir(images_path))):
-            out_fn = join(videos_output_path, folder + '.mp4')
-            if method == 'original':
-                fps = fps_dict[folder]
-            else:
-                # We take the fps of the source video for manipulated videos
-                fps = fps_dict[folder.split('_')[-1]]
-            # Compress as video
-            if not os.path.exists(out_fn):
-                make_video_from_images(
-                    join(images_path, folder),
-                    out_fn,
-                    crf=crf, fps=fps,
-                )
-
-            if extract_images:
-                # Check for correct extraction or repeat where we left of
-                try:
-                    num_out_frames = len(os.listdir(join(images_output_path,
-                                                         folder)))
-                    num_in_frames = len(os.listdir(join(images_path, folder)))
-                    if not (os.path.exists(join(images_output_path, folder)) and
-                            num_in_frames == num_out_frames):
-                        # Extract images
-                        extract_frames(out_fn, join(images_output_path, folder))
-                except FileNotFoundError:
-                    # Extract images
-                    extract_frames(out_fn, join(images_output_path, folder))
-                # Check if everything was correct
-                num_out_frames = len(
-                    os.listdir(join(images_output_path, folder)))
-                num_in_frames = len(os.listdir(join(images_path, folder)))
-                if num_in_frames != num_out_frames:
-                    tqdm.write('Number of frames in {} is wrong: {}/{}'.format(
-                        folder, num_out_frames, num_in_frames
-                    ))
+        return False
+    if num_frames != num_in_frames:
+        return False
+    if manifest is not None:
+        manifest.record(images_output_path, num_frames)
+    return True
+
+
+def run_compression_job(job, extract_images=True, threads=None,
+                        manifest=None):
+    """
+    Compresses one sequence with all crfs of the job and extracts the images
+    of the compressed videos. Outputs are written to a temporary path and
+    renamed once complete. Completed outputs are recorded in the manifest and
+    skipped without listing any directory when the job is run again.
+    :param job: see build_compression_jobs
+    :param extract_images: extract the images of the compressed videos
+    :param threads: ffmpeg threads
+    :param manifest: optional manifest.JobManifest
+    """
+    video_paths = job['video_paths']
+    images_output_paths = job['images_output_paths']
+    if manifest is not None and all(
+            manifest.is_done(video_paths[crf]) and
+            (not extract_images or manifest.is_done(images_output_paths[crf]))
+            for crf in job['crfs']):
+        return
+
+    num_in_frames = len(os.listdir(job['images_path']))
+    # Compress as video, all missing crfs with a single ffmpeg call
+    missing = {crf: video_paths[crf] for crf in job['crfs']
+               if not _video_is_complete(video_paths[crf], num_in_frames,
+                                         manifest)}
+    if missing:
+        tmp_fns = {}
+        for crf, out_fn in missing.items():
+            os.makedirs(os.path.dirname(out_fn), exist_ok=True)
+            tmp_fns[crf] = temporary_path(out_fn)
+            remove_output(tmp_fns[crf])
+        if len(tmp_fns) == 1:
+            crf, tmp_fn = list(tmp_fns.items())[0]
+            make_video_from_images(job['images_path'], tmp_fn, crf=crf,
+                                   fps=job['fps'], threads=threads)
+        else:
+            make_videos_from_images(job['images_path'], tmp_fns,
+                                    fps=job['fps'], threads=threads)
+        for crf, out_fn in missing.items():
+            commit_output(tmp_fns[crf], out_fn)
+            if manifest is not None:
+                manifest.record(out_fn, count_video_frames(out_fn),
+                                file_checksum(out_fn))
+
+    for crf in job['crfs']:
+        images_output_path = images_output_paths[crf]
+        if not extract_images or _images_are_complete(
+                images_output_path, num_in_frames, manifest):
+            continue
+        # Extract images
+        if job['output_format'] == 'npy':
+            tmp_path = temporary_path(images_output_path)
+        else:
+            tmp_path = images_output_path + '.tmp'
+        remove_output(tmp_path)
+        num_out_frames = extract_frames(video_paths[crf], tmp_path,
+                                        job['output_format'], threads)
+        # Check if everything was correct, wrong outputs are neither
+        # committed nor recorded so that they are extracted again
+        if num_in_frames != num_out_frames:
+            remove_output(tmp_path)
+            raise Exception('Wrong number of frames in {} c{}: {}/{}'.format(
+                job['folder'], crf, num_out_frames, num_in_frames))
+        commit_output(tmp_path, images_output_path)
+        if manifest is not None:
+            manifest.record(images_output_path, num_out_frames)
+
+
+def _run_with_retries(job, retries, **kwargs):
+    for attempt in range(retries + 1):
+        try:
+            return run_compression_job(job, **kwargs)
+        except subprocess.CalledProcessError as e:
+            if attempt == retries:
+                raise
+            tqdm.write('Retrying {}: {}'.format(
+                _job_name(job),
+                e.output.decode(errors='ignore').strip().split('\n')[-1]))
+
+
+def run_compression_jobs(jobs, num_processes=1, threads_per_job=None,
+                         retries=1, extract_images=True, manifest=None):
+    """
+    Runs compression jobs with a pool of concurrent ffmpeg processes.
+    :param jobs: list of jobs, see build_compression_jobs
+    :param num_processes: number of concurrent ffmpeg processes
+    :param threads_per_job: ffmpeg threads per process, None lets ffmpeg
+    decide (which uses all cores for every process)
+    :param retries: number of retries of a failed job
+    :param extract_images: extract the images of the compressed videos
+    :param manifest: optional manifest.JobManifest of completed outputs
+    :return: list of failed jobs
+    """
+    failed = []
+    # The work is done by ffmpeg subprocesses, threads are sufficient
+    with ThreadPoolExecutor(num_processes) as executor:
+        futures = {executor.submit(_run_with_retries, job, retries,
+                                   extract_images=extract_images,
+                                   threads=threads_per_job,
+                                   manifest=manifest): job
+                   for job in jobs}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            job = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                tqdm.write('Failed {}: {}'.format(_job_name(job), e))
+                failed.append(job)
+    return failed
+
+
+def create_compressed_method(data_path, method='Face2Face',
+                             extract_images=True, num_processes=1,
+                             threads_per_job=None, retries=1,
+                             manifest_path=None, single_pass=False,
+                             output_format='png', **kwargs):
+    methods = method if isinstance(method, list) else [method]
+    jobs = build_compression_jobs(data_path, methods,
+                                  single_pass=single_pass,
+                                  output_format=output_format)
+    if manifest_path is None:
+        manifest_path = join(data_path, 'compression_manifest.jsonl')
+    manifest = JobManifest(manifest_path)
+    print('Starting {} jobs'.format(len(jobs)))
+    failed = run_compression_jobs(jobs, num_processes, threads_per_job,
+                                  retries, extract_images, manifest)
+    manifest.compact()
+    manifest.close()
+    if failed:
+        print('{} jobs failed'.format(len(failed)))
 
 
 if __name__ == '__main__':
@@ -152,6 +361,22 @@ if __name__ == '__main__':
     p.add_argument('--method', default='original')
     p.add_argument('--crf', type=int, default=0)
     p.add_argument('--fps', type=int, default=30)
+    p.add_argument('--num_processes', '-p', type=int, default=1,
+                   help='Number of concurrent ffmpeg processes')
+    p.add_argument('--threads_per_job', type=int, default=None,
+                   help='Threads per ffmpeg process')
+    p.add_argument('--retries', type=int, default=1,
+                   help='Number of retries of failed ffmpeg jobs')
+    p.add_argument('--manifest_path', type=str, default=None,
+                   help='Ledger of completed outputs, defaults to '
+                        '<data_path>/compression_manifest.jsonl')
+    p.add_argument('--single_pass', action='store_true',
+                   help='Encode all crfs of a sequence with one ffmpeg call '
+                        'that decodes the images only once')
+    p.add_argument('--output_format', type=str, choices=['png', 'npy'],
+                   default='png',
+                   help='Extracted frames as png images or one memory '
+                        'mappable npy frame store per video')
     args = p.parse_args()
 
     if args.mode == 'compress_folder':
@@ -161,7 +386,6 @@ if __name__ == '__main__':
     if args.mode == 'compress_v1-all':
         compress_v1(**vars(args))
     elif args.mode == 'compress_all':
-        for method in ['Face2Face', 'FaceSwap', 'Deepfakes']:
-            args.method = method
-            print(args.method)
-            create_compressed_method(**vars(args))
+        # All jobs of all methods are scheduled together
+        args.method = ['Face2Face', 'FaceSwap', 'Deepfakes']
+        create_compressed_method(**vars(args))
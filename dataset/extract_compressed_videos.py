@@ -8,11 +8,18 @@ Date: 25.01.2019
 """
 import os
 from os.path import join
+import time
 import argparse
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import cv2
 from tqdm import tqdm
 
+from manifest import JobManifest, commit_output, remove_output, \
+    temporary_path, count_video_frames
+from frame_store import extract_frames_to_store, num_stored_frames
+
 
 DATASET_PATHS = {
     'original': 'original_sequences',
@@ -21,18 +28,23 @@ DATASET_PATHS = {
     'FaceSwap': 'manipulated_sequences/FaceSwap'
 }
 COMPRESSION = ['c0', 'c23', 'c40']
+OUTPUT_FORMATS = ['png', 'npy']
 
 
 def extract_frames(data_path, output_path, method='cv2'):
-    """Method to extract frames, either with ffmpeg or opencv. FFmpeg won't
+    """Method to extract frames, either with ffmpeg or opencv, or with
+    opencv into a single npy frame store (see frame_store.py). FFmpeg won't
     start from 0 so we would have to rename if we want to keep the filenames
-    coherent."""
+    coherent. Returns the number of extracted frames."""
+    if method == 'npy':
+        return extract_frames_to_store(data_path, output_path)
     os.makedirs(output_path, exist_ok=True)
     if method == 'ffmpeg':
         subprocess.check_output(
             'ffmpeg -i {} {}'.format(
                 data_path, join(output_path, '%04d.png')),
             shell=True, stderr=subprocess.STDOUT)
+        return len(os.listdir(output_path))
     elif method == 'cv2':
         reader = cv2.VideoCapture(data_path)
         frame_num = 0
@@ -44,19 +56,119 @@ def extract_frames(data_path, output_path, method='cv2'):
                         image)
             frame_num += 1
         reader.release()
+        return frame_num
     else:
         raise Exception('Wrong extract frames method: {}'.format(method))
 
 
-def extract_method_videos(data_path, dataset, compression):
+def build_extraction_jobs(data_path, datasets, compression,
+                          output_format='png'):
+    """Lists the videos of the specified methods and compression in the
+    FaceForensics++ file structure. With output_format 'npy' the frames of
+    every video are written to a single frame store
+    <compression>/frames/<video>.npy instead of an image folder.
+    :return: list of (video path, output path, temporary output path,
+    extract_frames method)"""
+    if output_format not in OUTPUT_FORMATS:
+        raise Exception('Wrong output format: {}'.format(output_format))
+    jobs = []
+    for dataset in datasets:
+        videos_path = join(data_path, DATASET_PATHS[dataset], compression,
+                           'videos')
+        images_path = join(data_path, DATASET_PATHS[dataset], compression,
+                           'images' if output_format == 'png' else 'frames')
+        for video in sorted(os.listdir(videos_path)):
+            if output_format == 'png':
+                output = join(images_path, video.split('.')[0])
+                jobs.append((join(videos_path, video), output,
+                             output + '.tmp', 'cv2'))
+            else:
+                output = join(images_path, video.split('.')[0] + '.npy')
+                jobs.append((join(videos_path, video), output,
+                             temporary_path(output), 'npy'))
+    return jobs
+
+
+def _num_extracted_frames(output):
+    if os.path.isfile(output):
+        return num_stored_frames(output)
+    elif os.path.isdir(output):
+        return len(os.listdir(output))
+    return 0
+
+
+def _extract_video(job, manifest, stats):
+    video_path, output, tmp_output, method = job
+    start_time = time.time()
+    # Number of frames of the video by its packets, fails for unreadable
+    # (e.g., truncated) videos
+    num_video_frames = count_video_frames(video_path)
+    # Outputs that exist but are not recorded (e.g., from runs without
+    # manifest) are verified once by their number of frames
+    if num_video_frames > 0 and \
+            _num_extracted_frames(output) == num_video_frames:
+        if manifest is not None:
+            manifest.record(output, num_video_frames)
+        return
+    remove_output(tmp_output)
+    num_frames = extract_frames(video_path, tmp_output, method=method)
+    # Incomplete extractions are neither committed nor recorded so that they
+    # are extracted again
+    if num_frames == 0 or num_frames != num_video_frames:
+        remove_output(tmp_output)
+        raise Exception('Wrong number of frames: {}/{}'.format(
+            num_frames, num_video_frames))
+    commit_output(tmp_output, output)
+    if manifest is not None:
+        manifest.record(output, num_frames)
+    # Every worker thread only updates its own entry
+    worker_stats = stats.setdefault(threading.current_thread().name,
+                                    [0, 0, 0.])
+    worker_stats[0] += 1
+    worker_stats[1] += num_frames
+    worker_stats[2] += time.time() - start_time
+
+
+def extract_videos(jobs, workers=4, manifest=None):
+    """
+    Extracts videos with a bounded number of concurrent workers. Decoding
+    and image encoding release the GIL, so threads are sufficient; the
+    number of workers bounds the concurrent reads and writes on disk. Videos
+    whose output is recorded in the manifest or, if not recorded, has the
+    number of frames of the video are skipped, new outputs are written to
+    a temporary path and renamed once complete.
+    :param jobs: see build_extraction_jobs
+    :param workers: number of concurrently extracted videos
+    :param manifest: optional manifest.JobManifest
+    :return: dict {worker: [videos, frames, seconds]}
+    """
+    if manifest is not None:
+        jobs = [job for job in jobs if not manifest.is_done(job[1])]
+    stats = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_extract_video, job, manifest, stats): job
+                   for job in jobs}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            try:
+                future.result()
+            except Exception as e:
+                tqdm.write('Failed {}: {}'.format(futures[future][0], e))
+    return stats
+
+
+def print_worker_summary(stats):
+    for worker, (videos, frames, seconds) in sorted(stats.items()):
+        print('{}: {} videos, {} frames, {:.1f} frames/s'.format(
+            worker, videos, frames, frames / max(seconds, 1e-6)))
+
+
+def extract_method_videos(data_path, dataset, compression, manifest=None,
+                          output_format='png', workers=1):
     """Extracts all videos of a specified method and compression in the
-    FaceForensics++ file structure"""
-    videos_path = join(data_path, DATASET_PATHS[dataset], compression, 'videos')
-    images_path = join(data_path, DATASET_PATHS[dataset], compression, 'images')
-    for video in tqdm(os.listdir(videos_path)):
-        image_folder = video.split('.')[0]
-        extract_frames(join(videos_path, video),
-                       join(images_path, image_folder))
+    FaceForensics++ file structure, see extract_videos."""
+    jobs = build_extraction_jobs(data_path, [dataset], compression,
+                                 output_format)
+    return extract_videos(jobs, workers, manifest)
 
 
 if __name__ == '__main__':
@@ -69,11 +181,26 @@ if __name__ == '__main__':
                    default='all')
     p.add_argument('--compression', '-c', type=str, choices=COMPRESSION,
                    default='c0')
+    p.add_argument('--output_format', type=str, choices=OUTPUT_FORMATS,
+                   default='png',
+                   help='png images or one memory mappable npy frame store '
+                        'per video')
+    p.add_argument('--workers', '-w', type=int, default=4,
+                   help='Number of videos extracted concurrently, across '
+                        'all datasets')
+    p.add_argument('--manifest_path', type=str, default=None,
+                   help='Ledger of extracted videos, defaults to '
+                        '<data_path>/extraction_manifest.jsonl')
     args = p.parse_args()
 
-    if args.dataset == 'all':
-        for dataset in DATASET_PATHS.keys():
-            args.dataset = dataset
-            extract_method_videos(**vars(args))
-    else:
-        extract_method_videos(**vars(args))
+    manifest = JobManifest(args.manifest_path or
+                           join(args.data_path, 'extraction_manifest.jsonl'))
+    datasets = DATASET_PATHS.keys() if args.dataset == 'all' \
+        else [args.dataset]
+    # Videos of all datasets share the same workers
+    jobs = build_extraction_jobs(args.data_path, datasets, args.compression,
+                                 args.output_format)
+    stats = extract_videos(jobs, args.workers, manifest)
+    print_worker_summary(stats)
+    manifest.compact()
+    manifest.close()
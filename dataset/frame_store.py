@@ -0,0 +1,97 @@
+"""
+Frame stores: all decoded frames of a video in a single uint8 .npy array
+[num_frames, height, width, 3] (BGR, i.e., opencv form) instead of one png
+per frame. The array can be memory mapped with
+np.load(path, mmap_mode='r') to read single frames without decoding.
+
+Frames are appended while the video is decoded, the npy header is reserved
+at the beginning of the file and written once the number of frames is
+known.
+
+Author: Andreas Rössler
+"""
+import os
+import cv2
+import numpy as np
+
+
+# Size of the reserved npy header (magic, version, header length, header),
+# has to be a multiple of 64 to keep the frames aligned
+HEADER_SIZE = 128
+
+
+class FrameStoreWriter(object):
+    """
+    Appends frames of a video to a frame store.
+    """
+    def __init__(self, path):
+        """
+        :param path: output .npy file
+        """
+        self.path = path
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.file = open(path, 'wb')
+        self.file.write(b'\0' * HEADER_SIZE)
+        self.frame_shape = None
+        self.num_frames = 0
+
+    def add(self, image):
+        """
+        :param image: numpy image in opencv form (BGR, uint8)
+        """
+        if self.frame_shape is None:
+            self.frame_shape = image.shape
+        elif image.shape != self.frame_shape:
+            raise Exception('Wrong frame shape: {}, expected {}'.format(
+                image.shape, self.frame_shape))
+        self.file.write(np.ascontiguousarray(image, dtype=np.uint8).data)
+        self.num_frames += 1
+
+    def close(self):
+        """Writes the header, returns the number of frames."""
+        shape = (self.num_frames,) + tuple(self.frame_shape or (0, 0, 3))
+        header = "{{'descr': '|u1', 'fortran_order': False, " \
+                 "'shape': {}, }}".format(shape).encode('latin1')
+        # magic (6) + version (2) + header length (2), padded with spaces
+        # and terminated by a newline as required by the npy format 1.0
+        header = header.ljust(HEADER_SIZE - 10 - 1) + b'\n'
+        self.file.seek(0)
+        self.file.write(np.lib.format.magic(1, 0))
+        self.file.write(np.array(len(header), dtype='<u2').tobytes())
+        self.file.write(header)
+        self.file.close()
+        return self.num_frames
+
+
+def num_stored_frames(path):
+    """Number of frames of a frame store, only the header is read."""
+    return np.load(path, mmap_mode='r').shape[0]
+
+
+def extract_frames_to_store(video_path, output_path, threads=None):
+    """
+    Decodes a video with opencv into a frame store.
+    :param video_path: input video
+    :param output_path: output .npy file
+    :param threads: decoding threads (opencv>=4.5.2 only), None lets the
+    decoder decide
+    :return: number of frames
+    """
+    writer = FrameStoreWriter(output_path)
+    if threads and hasattr(cv2, 'CAP_PROP_N_THREADS'):
+        reader = cv2.VideoCapture(video_path, cv2.CAP_ANY,
+                                  [cv2.CAP_PROP_N_THREADS, threads])
+    else:
+        reader = cv2.VideoCapture(video_path)
+    try:
+        while reader.isOpened():
+            success, image = reader.read()
+            if not success:
+                break
+            writer.add(image)
+    finally:
+        reader.release()
+        num_frames = writer.close()
+    return num_frames
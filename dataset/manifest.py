@@ -0,0 +1,125 @@
+"""
+Persistent ledger of completed compression/extraction outputs, used to
+resume interrupted runs without scanning the output directories.
+
+Every completed output is appended as one json line (path, size, number of
+frames, checksum) and flushed to disk. Outputs are written to a temporary
+path first and renamed once complete, so an output that is listed in the
+manifest is never partially written.
+
+Author: Andreas Rössler
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+import subprocess
+
+
+def file_checksum(path, block_size=1 << 20):
+    """sha1 checksum of a file"""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def count_video_frames(path):
+    """Counts the frames of a video by its packets, nothing is decoded."""
+    output = subprocess.check_output(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+         '-count_packets', '-show_entries', 'stream=nb_read_packets',
+         '-of', 'csv=p=0', path], stderr=subprocess.STDOUT)
+    return int(output.decode().strip().split(',')[0])
+
+
+def temporary_path(path):
+    """Temporary path of an output, keeps the file extension for ffmpeg."""
+    root, ext = os.path.splitext(path)
+    return root + '.tmp' + ext
+
+
+def commit_output(tmp_path, path):
+    """Atomically moves a completed output from its temporary path."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+
+def remove_output(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class JobManifest(object):
+    """
+    Jsonl ledger of completed outputs. Lookups are O(1) and only stat the
+    output, the ledger can be written from multiple threads.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Incomplete last line of an interrupted run
+                        continue
+                    self.entries[entry['path']] = entry
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.file = open(path, 'a')
+
+    def is_done(self, path):
+        """
+        :param path: output file or folder
+        :return: True if the output is recorded and still has the recorded
+        size (files) or still exists (folders)
+        """
+        entry = self.entries.get(path)
+        if entry is None:
+            return False
+        if entry['size'] is None:
+            return os.path.isdir(path)
+        try:
+            return os.path.getsize(path) == entry['size']
+        except OSError:
+            return False
+
+    def record(self, path, num_frames=None, checksum=None):
+        """
+        Records a completed output.
+        :param path: output file or folder
+        :param num_frames: number of frames of the output
+        :param checksum: optional checksum, see file_checksum
+        """
+        entry = {'path': path, 'num_frames': num_frames,
+                 'size': os.path.getsize(path) if os.path.isfile(path)
+                 else None,
+                 'checksum': checksum}
+        with self.lock:
+            self.entries[path] = entry
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def compact(self):
+        """Rewrites the ledger with one line per output."""
+        with self.lock:
+            self.file.close()
+            with open(self.path + '.tmp', 'w') as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry) + '\n')
+            os.replace(self.path + '.tmp', self.path)
+            self.file = open(self.path, 'a')
+
+    def close(self):
+        self.file.close()